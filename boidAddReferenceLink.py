@@ -12,9 +12,6 @@ import random
 #inport time
 import time
 
-# Initialize Pygame
-pygame.init()
-
 # experiment
 experiment = True
 start_time = None
@@ -26,9 +23,7 @@ ex4stage = False
 # Set boid_screen 
 Width_screen, Height_screen = 1200, 800
 #set mode
-boid_screen = pygame.display.set_mode((Width_screen, Height_screen))
-# display caption
-pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+boid_screen = None  # Window surface, created by main()
 
 # Set more color
 WHITE = (255, 255, 255)
@@ -58,7 +53,7 @@ fog_level = 0  # Index in LEVELS
 weather_enabled = True
 
 # Font for displaying weather status
-font = pygame.font.Font(None, 36)
+font = None  # Status font, created by main()
 
 # Button parameters
 BUTTON_Width_screen = 100
@@ -283,78 +278,90 @@ def display_weather_status(boid_screen):
     boid_screen.blit(text_surface, (10, 10))
 
 
-# Main simulation loop
-# This part is adapted from [https://github.com/pramodaya/GeneticAlgorithms]
-boids = [Boid(random.randint(0, Width_screen), random.randint(0, Height_screen)) for _ in range(NUM_BOIDS)]
-#set running = true
-running = True
-#set clock by pygame
-clock_time = pygame.time.Clock()
-#end part
-
-while running:
-    # experiment
-    if experiment:
-        current_time = time.time()
-        if start_time == None:
-            start_time = current_time
-            weather_enabled = not weather_enabled
-        elif (current_time - start_time >= 10) and not (ex1stage):
-            print("10 second passed")
-            weather_enabled = not weather_enabled
-            fog_level += 1
-            # wind_level += 1
-            snow_level += 1
-            ex1stage = True
-        elif (current_time - start_time >= 20) and not (ex2stage):
-            print("20 second passed")
-            fog_level = 2
-            wind_level = 3
-            snow_level = 3
-            ex2stage = True
-        elif (current_time - start_time >= 30) and not (ex3stage):
-            print("30 second passed")
-            fog_level = 0
-            wind_level = 0
-            snow_level = 0
-            ex3stage = True
-
-            weather_enabled = not weather_enabled
-
-    # Event handling loop
+def main():
+    global boid_screen, font, ex1stage, ex2stage, ex3stage, start_time
+    global weather_enabled, wind_level, snow_level, fog_level
+    pygame.init()
+    boid_screen = pygame.display.set_mode((Width_screen, Height_screen))
+    pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+    font = pygame.font.Font(None, 36)
+
+    # Main simulation loop
     # This part is adapted from [https://github.com/pramodaya/GeneticAlgorithms]
-    for event in pygame.event.get():  # Iterate through all events in the event queue
-        if event.type == pygame.QUIT:  # Check if the user closes the window
-            running = False  # Set running to False to exit the game loop
-            # Check if a mouse button is pressed or released
-        handle_button_click(event)  # Call the function to handle button-related events
-            # Check if a key is pressed or released
-        handle_stick_event(event)  # Call the function to handle stick-related (keyboard) events
+    boids = [Boid(random.randint(0, Width_screen), random.randint(0, Height_screen)) for _ in range(NUM_BOIDS)]
+    #set running = true
+    running = True
+    #set clock by pygame
+    clock_time = pygame.time.Clock()
     #end part
 
-    # Clear the boid_screen
-    boid_screen.fill(BLACK)
+    while running:
+        # experiment
+        if experiment:
+            current_time = time.time()
+            if start_time == None:
+                start_time = current_time
+                weather_enabled = not weather_enabled
+            elif (current_time - start_time >= 10) and not (ex1stage):
+                print("10 second passed")
+                weather_enabled = not weather_enabled
+                fog_level += 1
+                # wind_level += 1
+                snow_level += 1
+                ex1stage = True
+            elif (current_time - start_time >= 20) and not (ex2stage):
+                print("20 second passed")
+                fog_level = 2
+                wind_level = 3
+                snow_level = 3
+                ex2stage = True
+            elif (current_time - start_time >= 30) and not (ex3stage):
+                print("30 second passed")
+                fog_level = 0
+                wind_level = 0
+                snow_level = 0
+                ex3stage = True
+
+                weather_enabled = not weather_enabled
+
+        # Event handling loop
+        # This part is adapted from [https://github.com/pramodaya/GeneticAlgorithms]
+        for event in pygame.event.get():  # Iterate through all events in the event queue
+            if event.type == pygame.QUIT:  # Check if the user closes the window
+                running = False  # Set running to False to exit the game loop
+                # Check if a mouse button is pressed or released
+            handle_button_click(event)  # Call the function to handle button-related events
+                # Check if a key is pressed or released
+            handle_stick_event(event)  # Call the function to handle stick-related (keyboard) events
+        #end part
+
+        # Clear the boid_screen
+        boid_screen.fill(BLACK)
+
+        # Draw buttons
+        draw_buttons(boid_screen)
 
-    # Draw buttons
-    draw_buttons(boid_screen)
+        # Display weather status
+        display_weather_status(boid_screen)
 
-    # Display weather status
-    display_weather_status(boid_screen)
+        # Draw and update the wind stick
+        draw_stick(boid_screen)
+        draw_wind_direction(boid_screen)
 
-    # Draw and update the wind stick
-    draw_stick(boid_screen)
-    draw_wind_direction(boid_screen)
+        # Update and draw boids
+        snow_intensity = LEVELS[snow_level] if weather_enabled else 0
+        fog_density = LEVELS[fog_level] if weather_enabled else 0
+
+        for boid in boids:
+            boid.update(boids, wind_vector, snow_intensity, fog_density)
+            boid.draw(boid_screen)
 
-    # Update and draw boids
-    snow_intensity = LEVELS[snow_level] if weather_enabled else 0
-    fog_density = LEVELS[fog_level] if weather_enabled else 0
+        # Refresh display
+        pygame.display.flip()
+        clock_time.tick(30)
 
-    for boid in boids:
-        boid.update(boids, wind_vector, snow_intensity, fog_density)
-        boid.draw(boid_screen)
+    pygame.quit()
 
-    # Refresh display
-    pygame.display.flip()
-    clock_time.tick(30)
 
-pygame.quit()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
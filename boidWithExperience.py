@@ -2,9 +2,6 @@ import pygame
 import random
 import time
 
-# Initialize Pygame
-pygame.init()
-
 # experiment
 experiment = True
 start_time = None
@@ -15,8 +12,7 @@ ex4stage = False
 
 # Screen dimensions
 WIDTH, HEIGHT = 1200, 800
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+screen = None  # Window surface, created by main()
 
 # Colors
 BLACK = (0, 0, 0)
@@ -45,7 +41,7 @@ fog_level = 0  # Index in LEVELS
 weather_enabled = True
 
 # Font for displaying weather status
-font = pygame.font.Font(None, 36)
+font = None  # Status font, created by main()
 
 # Button parameters
 BUTTON_WIDTH = 100
@@ -266,71 +262,83 @@ def display_weather_status(screen):
     screen.blit(text_surface, (10, 10))
 
 
-# Main simulation loop
-boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
-running = True
-clock = pygame.time.Clock()
-
-while running:
-    # experiment
-    if experiment:
-
-        current_time = time.time()
-        if start_time == None:
-            start_time = current_time
-            weather_enabled = not weather_enabled
-        elif (current_time - start_time >= 10) and not (ex1stage):
-            print("10 second passed")
-            weather_enabled = not weather_enabled
-            fog_level += 1
-            # wind_level += 1
-            snow_level += 1
-            ex1stage = True
-        elif (current_time - start_time >= 20) and not (ex2stage):
-            print("20 second passed")
-            fog_level = 2
-            wind_level = 3
-            snow_level = 3
-            ex2stage = True
-        elif (current_time - start_time >= 30) and not (ex3stage):
-            print("30 second passed")
-            fog_level = 0
-            wind_level = 0
-            snow_level = 0
-            ex3stage = True
-
-            weather_enabled = not weather_enabled
-
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        handle_button_click(event)
-        handle_stick_event(event)
-
-    # Clear the screen
-    screen.fill(BLACK)
-
-    # Draw buttons
-    draw_buttons(screen)
-
-    # Display weather status
-    display_weather_status(screen)
-
-    # Draw and update the wind stick
-    draw_stick(screen)
-    draw_wind_direction(screen)
-
-    # Update and draw boids
-    snow_intensity = LEVELS[snow_level] if weather_enabled else 0
-    fog_density = LEVELS[fog_level] if weather_enabled else 0
-
-    for boid in boids:
-        boid.update(boids, wind_vector, snow_intensity, fog_density)
-        boid.draw(screen)
-
-    # Refresh display
-    pygame.display.flip()
-    clock.tick(30)
-
-pygame.quit()
\ No newline at end of file
+def main():
+    global screen, font, ex1stage, ex2stage, ex3stage, start_time
+    global weather_enabled, wind_level, snow_level, fog_level
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+    font = pygame.font.Font(None, 36)
+
+    # Main simulation loop
+    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
+    running = True
+    clock = pygame.time.Clock()
+
+    while running:
+        # experiment
+        if experiment:
+
+            current_time = time.time()
+            if start_time == None:
+                start_time = current_time
+                weather_enabled = not weather_enabled
+            elif (current_time - start_time >= 10) and not (ex1stage):
+                print("10 second passed")
+                weather_enabled = not weather_enabled
+                fog_level += 1
+                # wind_level += 1
+                snow_level += 1
+                ex1stage = True
+            elif (current_time - start_time >= 20) and not (ex2stage):
+                print("20 second passed")
+                fog_level = 2
+                wind_level = 3
+                snow_level = 3
+                ex2stage = True
+            elif (current_time - start_time >= 30) and not (ex3stage):
+                print("30 second passed")
+                fog_level = 0
+                wind_level = 0
+                snow_level = 0
+                ex3stage = True
+
+                weather_enabled = not weather_enabled
+
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            handle_button_click(event)
+            handle_stick_event(event)
+
+        # Clear the screen
+        screen.fill(BLACK)
+
+        # Draw buttons
+        draw_buttons(screen)
+
+        # Display weather status
+        display_weather_status(screen)
+
+        # Draw and update the wind stick
+        draw_stick(screen)
+        draw_wind_direction(screen)
+
+        # Update and draw boids
+        snow_intensity = LEVELS[snow_level] if weather_enabled else 0
+        fog_density = LEVELS[fog_level] if weather_enabled else 0
+
+        for boid in boids:
+            boid.update(boids, wind_vector, snow_intensity, fog_density)
+            boid.draw(screen)
+
+        # Refresh display
+        pygame.display.flip()
+        clock.tick(30)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
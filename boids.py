@@ -2,13 +2,9 @@ import pygame
 import random
 import math
 
-# Initialize Pygame
-pygame.init()
-
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Boid Flocking Simulation")
+screen = None  # Window surface, created by main()
 
 # Colors
 BLACK = (0, 0, 0)
@@ -90,28 +86,39 @@ class Boid:
     def draw(self, screen):
         pygame.draw.circle(screen, BOID_COLOR, (int(self.position.x), int(self.position.y)), BOID_RADIUS)
 
-# Create boids
-boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
 
-# Simulation loop
-running = True
-clock = pygame.time.Clock()
+def main():
+    global screen
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Boid Flocking Simulation")
+
+    # Create boids
+    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
+
+    # Simulation loop
+    running = True
+    clock = pygame.time.Clock()
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        # Clear screen
+        screen.fill(BLACK)
+
+        # Update and draw boids
+        for boid in boids:
+            boid.update(boids)
+            boid.draw(screen)
 
-    # Clear screen
-    screen.fill(BLACK)
+        # Refresh screen
+        pygame.display.flip()
+        clock.tick(30)
 
-    # Update and draw boids
-    for boid in boids:
-        boid.update(boids)
-        boid.draw(screen)
+    pygame.quit()
 
-    # Refresh screen
-    pygame.display.flip()
-    clock.tick(30)
 
-pygame.quit()
+if __name__ == "__main__":
+    main()
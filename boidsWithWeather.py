@@ -1,13 +1,9 @@
 import pygame
 import random
 
-# Initialize Pygame
-pygame.init()
-
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+screen = None  # Window surface, created by main()
 
 # Colors
 BLACK = (0, 0, 0)
@@ -136,33 +132,44 @@ def draw_fog(screen):
     fog_surface.fill((255, 255, 255, int(FOG_DENSITY * 150)))  # Adjust opacity by fog density
     screen.blit(fog_surface, (0, 0))
 
-# Create boids
-boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
 
-# Simulation loop
-running = True
-clock = pygame.time.Clock()
+def main():
+    global screen
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+
+    # Create boids
+    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
+
+    # Simulation loop
+    running = True
+    clock = pygame.time.Clock()
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
 
-    # Clear screen
-    screen.fill(BLACK)
+        # Clear screen
+        screen.fill(BLACK)
+
+        # Draw weather effects
+        draw_wind(screen)
+        draw_rain(screen)
+        draw_fog(screen)
+
+        # Update and draw boids
+        for boid in boids:
+            boid.update(boids)
+            boid.draw(screen)
 
-    # Draw weather effects
-    draw_wind(screen)
-    draw_rain(screen)
-    draw_fog(screen)
+        # Refresh screen
+        pygame.display.flip()
+        clock.tick(30)
 
-    # Update and draw boids
-    for boid in boids:
-        boid.update(boids)
-        boid.draw(screen)
+    pygame.quit()
 
-    # Refresh screen
-    pygame.display.flip()
-    clock.tick(30)
 
-pygame.quit()
+if __name__ == "__main__":
+    main()
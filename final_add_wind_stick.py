@@ -3,13 +3,9 @@ import random
 import csv
 import time
 
-# Initialize Pygame
-pygame.init()
-
 # Screen dimensions
 WIDTH, HEIGHT = 1200, 800
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+screen = None  # Window surface, created by main()
 
 # Colors
 BLACK = (0, 0, 0)
@@ -38,7 +34,7 @@ fog_level = 0   # Index in LEVELS
 weather_enabled = True  # Toggle for weather effects
 
 # Font for displaying weather status
-font = pygame.font.Font(None, 36)
+font = None  # Status font, created by main()
 
 # Button parameters
 BUTTON_WIDTH = 100
@@ -229,41 +225,53 @@ def display_weather_status(screen):
     text_surface = font.render(status_text, True, WHITE)
     screen.blit(text_surface, (10, 10))
 
-# Main simulation loop
-boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
-running = True
-clock = pygame.time.Clock()
 
-while running:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        handle_button_click(event)
-        handle_stick_event(event)
+def main():
+    global screen, font
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+    font = pygame.font.Font(None, 36)
+
+    # Main simulation loop
+    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) for _ in range(NUM_BOIDS)]
+    running = True
+    clock = pygame.time.Clock()
+
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            handle_button_click(event)
+            handle_stick_event(event)
 
-    # Clear the screen
-    screen.fill(BLACK)
+        # Clear the screen
+        screen.fill(BLACK)
 
-    # Draw buttons
-    draw_buttons(screen)
+        # Draw buttons
+        draw_buttons(screen)
 
-    # Display weather status
-    display_weather_status(screen)
+        # Display weather status
+        display_weather_status(screen)
 
-    # Draw and update the wind stick
-    draw_stick(screen)
-    draw_wind_direction(screen)
+        # Draw and update the wind stick
+        draw_stick(screen)
+        draw_wind_direction(screen)
+
+        # Update and draw boids
+        snow_intensity = LEVELS[snow_level] if weather_enabled else 0
+        fog_density = LEVELS[fog_level] if weather_enabled else 0
+
+        for boid in boids:
+            boid.update(boids, wind_vector, snow_intensity, fog_density)
+            boid.draw(screen)
 
-    # Update and draw boids
-    snow_intensity = LEVELS[snow_level] if weather_enabled else 0
-    fog_density = LEVELS[fog_level] if weather_enabled else 0
+        # Refresh display
+        pygame.display.flip()
+        clock.tick(30)
 
-    for boid in boids:
-        boid.update(boids, wind_vector, snow_intensity, fog_density)
-        boid.draw(screen)
+    pygame.quit()
 
-    # Refresh display
-    pygame.display.flip()
-    clock.tick(30)
 
-pygame.quit()
+if __name__ == "__main__":
+    main()
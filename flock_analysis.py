@@ -0,0 +1,206 @@
+# Summaries of metrics logs such as flocking_weather_data.csv.
+#
+# Every file is split by Weather_Config (rows keep their order inside a
+# config) and each numeric metric gets its mean and spread, a rolling mean
+# and variance over a window of rows, and the row at which the rolling mean
+# settles for good: the first window after which it stays within tolerance
+# of its final value. Files are analyzed in parallel processes, and with several
+# files every config also gets a row pooled over all of them; logs written
+# with different columns (say, the shipped log and a flock_sim.py run with
+# Step Time) are summarized over the metrics they share. Summaries are
+# kept in the result cache (flock_cache.py) by file content, so unchanged
+# logs are not parsed again.
+#
+# Example:
+#   python flock_analysis.py flocking_weather_data.csv sweep/*.csv --window 30 --output summary.csv
+
+import argparse
+import csv
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from flock_cache import DEFAULT_DIR, ResultCache, cache_key, file_digest
+
+WINDOW = 30  # Rows, one second of the pygame scripts at 30 FPS
+TOLERANCE = 0.01  # Relative to the final rolling mean
+STATISTICS = ("Mean", "Std", "Steady Row", "Steady Time", "Steady Mean", "Steady Var")
+
+
+# Weather_Config and Time as arrays, plus every other column that is numeric
+def load_metrics(path):
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        rows = [row for row in reader if row]
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    configs = np.array(columns[header.index("Weather_Config")], dtype=object)
+    metrics = {}
+    for name, values in zip(header, columns):
+        if name == "Weather_Config":
+            continue
+        try:
+            metrics[name] = np.array(values, dtype=float)
+        except ValueError:
+            pass  # e.g. the neighbor histogram
+    times = metrics.pop("Time", np.arange(len(rows), dtype=float))
+    return configs, times, metrics
+
+
+# Rolling mean and variance over every full window of values
+def rolling_mean_var(values, window):
+    window = min(window, len(values))
+    if window == 0:
+        return np.empty(0), np.empty(0)
+    centered = values - values.mean()  # Keeps the running sums well conditioned
+    sums = np.concatenate([[0.0], np.cumsum(centered)])
+    squares = np.concatenate([[0.0], np.cumsum(centered ** 2)])
+    mean = (sums[window:] - sums[:-window]) / window
+    var = np.maximum((squares[window:] - squares[:-window]) / window - mean ** 2, 0)
+    return mean + values.mean(), var
+
+
+# Index of the first window from which the rolling mean stays within
+# tolerance of its final value, relative to that value or to the spread of
+# the series for metrics that settle near zero
+def settled_window(rolling_mean, values, tolerance=TOLERANCE):
+    scale = max(abs(rolling_mean[-1]), values.std(), np.finfo(float).tiny)
+    unsettled = np.flatnonzero(np.abs(rolling_mean - rolling_mean[-1]) > tolerance * scale)
+    return unsettled[-1] + 1 if len(unsettled) else 0
+
+
+# Mean and Std over all rows; the row (and seconds since the first row) where
+# the metric reached steady state, its mean from there on and its mean
+# rolling variance once steady
+def summarize(times, values, window, tolerance):
+    mean, var = rolling_mean_var(values, window)
+    start = settled_window(mean, values, tolerance)
+    steady = int(start) + len(values) - len(mean)  # Last row of the first steady window
+    return [values.mean(), values.std(), steady, times[steady] - times[0], values[steady:].mean(),
+            var[start:].mean()]
+
+
+# Summary rows of one file: [file, config, rows, per-metric statistics...]
+def analyze_file(path, window=WINDOW, tolerance=TOLERANCE):
+    configs, times, metrics = load_metrics(path)
+    names = list(metrics)
+    rows = []
+    for config in dict.fromkeys(configs):
+        rows_of_config = np.flatnonzero(configs == config)
+        row = [path, config, len(rows_of_config)]
+        for name in names:
+            row += summarize(times[rows_of_config], metrics[name][rows_of_config], window, tolerance)
+        rows.append(row)
+    return names, rows
+
+
+def summary_header(names):
+    return ["File", "Weather_Config", "Rows"] + [f"{name} {stat}" for name in names for stat in STATISTICS]
+
+
+# One row per config with every statistic averaged over the files that ran it
+def pooled_rows(rows):
+    pooled = []
+    configs = [row[1] for row in rows]
+    for config in dict.fromkeys(configs):
+        group = np.array([row[2:] for row in rows if row[1] == config], dtype=float)
+        pooled.append([f"all ({len(group)})", config, int(group[:, 0].sum())] + group[:, 1:].mean(axis=0).tolist())
+    return pooled
+
+
+# Metric columns present in every file, in the order of the first
+def shared_names(file_names):
+    if not file_names:
+        return []
+    common = set(file_names[0]).intersection(*file_names[1:])
+    return [name for name in file_names[0] if name in common]
+
+
+# A summary row cut down to the statistics of the given metrics
+def select_metrics(row, file_names, names):
+    selected = row[:3]
+    for name in names:
+        start = 3 + file_names.index(name) * len(STATISTICS)
+        selected += row[start:start + len(STATISTICS)]
+    return selected
+
+
+# Summary header and rows of all files plus, with several files, pooled rows.
+# Files with different metric columns are summarized over the columns they
+# share; dropped maps each such file to the columns left out of it.
+def analyze(paths, window=WINDOW, tolerance=TOLERANCE, workers=None, cache=None):
+    results = [None] * len(paths)
+    keys = []
+    if cache is not None:
+        for i, path in enumerate(paths):
+            keys.append(cache_key({"file": file_digest(path), "window": window,
+                                   "tolerance": tolerance}, kind="analysis"))
+            cached = cache.get(keys[i])
+            if cached is not None:
+                names, rows = cached
+                results[i] = names, [[path] + row for row in rows]
+    todo = [i for i, result in enumerate(results) if result is None]
+    if len(todo) <= 1 or workers == 1:
+        fresh = [analyze_file(paths[i], window, tolerance) for i in todo]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            fresh = list(pool.map(analyze_file, [paths[i] for i in todo], [window] * len(todo),
+                                  [tolerance] * len(todo), chunksize=max(1, len(todo) // 64)))
+    for i, (names, rows) in zip(todo, fresh):
+        results[i] = names, rows
+        if cache is not None:
+            # Stored without the path, which is not part of the key
+            cache.put(keys[i], [names, [row[1:] for row in rows]])
+    names = shared_names([file_names for file_names, _ in results])
+    if results and not names:
+        raise ValueError("the files have no metric column in common")
+    rows, dropped = [], {}
+    for path, (file_names, file_rows) in zip(paths, results):
+        if file_names != names:
+            dropped[path] = [name for name in file_names if name not in names]
+            file_rows = [select_metrics(row, file_names, names) for row in file_rows]
+        rows += file_rows
+    if len(paths) > 1:
+        rows += pooled_rows(rows)
+    return summary_header(names), rows, dropped
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Summarize metrics logs by weather configuration.")
+    parser.add_argument("paths", nargs="+", metavar="CSV", help="metrics files to analyze")
+    parser.add_argument("--window", type=int, default=WINDOW,
+                        help="rows in the rolling mean and variance window")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="relative distance from the final rolling mean that counts as steady")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for analyzing several files (default: one per core)")
+    parser.add_argument("--cache", default=DEFAULT_DIR, help="directory of the result cache")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor fill the result cache")
+    parser.add_argument("--output", default=None, help="CSV file for the summary (default: stdout)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    cache = None if args.no_cache else ResultCache(args.cache)
+    try:
+        header, rows, dropped = analyze(args.paths, args.window, args.tolerance, args.workers, cache)
+    except ValueError as error:
+        parser.error(str(error))
+    for path, names in dropped.items():
+        print(f"{path}: left out {', '.join(names)}, which not every file has", file=sys.stderr)
+    file = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow([f"{value:.6g}" if isinstance(value, float) else value for value in row])
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == "__main__":
+    main()
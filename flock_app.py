@@ -0,0 +1,207 @@
+# Interactive weather-influenced flocking window on the array engine.
+#
+# The same buttons and wind stick as final_add_wind_stick.py drive a Flock
+# through Simulation, so the window and headless runs share one engine and
+# one metrics format. Metrics go through BufferedMetricsWriter, which is
+# flushed and closed when the window is closed.
+#
+# The world can be larger than the window: the mouse wheel zooms, and
+# dragging with the right mouse button or the arrow keys pan the camera.
+#
+# Example:
+#   python flock_app.py --boids 200 --output flocking_weather_data.csv
+#   python flock_app.py --boids 200000 --world-width 40000 --world-height 25000
+#   python flock_app.py --boids 20000 --backend numba --trace-allocations --output frames.csv
+
+import argparse
+import sys
+
+import pygame
+
+from flock_engine import BACKENDS, HEIGHT, LEVELS, NUM_BOIDS, WIDTH, Flock
+from flock_metrics import FLUSH_INTERVAL, BufferedMetricsWriter, metrics_header
+from flock_obstacles import ObstacleField
+from flock_render import FPS, WHITE, Camera, Renderer
+from flock_sim import Simulation, Weather
+from flock_species import PRESETS, SpeciesMix
+
+# Button parameters
+BUTTON_WIDTH = 100
+BUTTON_HEIGHT = 40
+BUTTON_MARGIN = 10
+BUTTON_COLOR = (50, 50, 50)
+BUTTON_HOVER_COLOR = (100, 100, 100)
+BUTTON_TEXT_COLOR = WHITE
+
+# Stick controller parameters
+STICK_RADIUS = 50
+STICK_KNOB_RADIUS = 15
+
+# Camera controls
+ZOOM_STEP = 1.25  # Zoom factor per mouse wheel notch
+PAN_SPEED = 20    # Screen pixels per frame while an arrow key is held
+
+
+def handle_camera_event(event, camera):
+    if event.type == pygame.MOUSEWHEEL:
+        camera.zoom_at(ZOOM_STEP ** event.y, pygame.mouse.get_pos())
+    elif event.type == pygame.MOUSEMOTION and event.buttons[2]:
+        camera.pan(*event.rel)
+
+
+def pan_with_keys(camera):
+    keys = pygame.key.get_pressed()
+    dx = (keys[pygame.K_LEFT] - keys[pygame.K_RIGHT]) * PAN_SPEED
+    dy = (keys[pygame.K_UP] - keys[pygame.K_DOWN]) * PAN_SPEED
+    if dx or dy:
+        camera.pan(dx, dy)
+
+
+# Weather buttons and wind stick
+class WeatherPanel:
+    def __init__(self, width=WIDTH, height=HEIGHT):
+        def row(n, x):
+            return pygame.Rect(x, height - n * (BUTTON_HEIGHT + BUTTON_MARGIN), BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.buttons = {
+            "Toggle": row(7, 10),
+            "Wind +": row(6, 10), "Wind -": row(6, 120),
+            "Snow +": row(5, 10), "Snow -": row(5, 120),
+            "Fog +": row(4, 10), "Fog -": row(4, 120),
+        }
+        self.font = pygame.font.Font(None, 36)
+        self.stick_center = pygame.Vector2(width - 150, height - 150)
+        self.stick_knob_position = self.stick_center.copy()
+        self.dragging_stick = False
+
+    def handle_button_click(self, event, weather):
+        if event.type != pygame.MOUSEBUTTONDOWN or event.button != 1:
+            return
+        for label, rect in self.buttons.items():
+            if not rect.collidepoint(event.pos):
+                continue
+            if label == "Toggle":
+                weather.enabled = not weather.enabled
+            elif weather.enabled:
+                name, sign = label.split()
+                attribute = f"{name.lower()}_level"
+                level = getattr(weather, attribute) + (1 if sign == "+" else -1)
+                if 0 <= level < len(LEVELS):
+                    setattr(weather, attribute, level)
+
+    def handle_stick_event(self, event, weather):
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if (self.stick_knob_position - pygame.Vector2(event.pos)).length() <= STICK_KNOB_RADIUS:
+                self.dragging_stick = True
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.dragging_stick = False
+            self.stick_knob_position = self.stick_center.copy()  # Back to the center on release
+            self.update_wind_from_stick(weather)
+        elif event.type == pygame.MOUSEMOTION and self.dragging_stick:
+            self.stick_knob_position = pygame.Vector2(event.pos)
+            self.update_wind_from_stick(weather)
+
+    def update_wind_from_stick(self, weather):
+        direction = self.stick_knob_position - self.stick_center
+        if direction.length() > STICK_RADIUS:
+            direction.scale_to_length(STICK_RADIUS)
+        weather.wind_direction = (direction.x / STICK_RADIUS, direction.y / STICK_RADIUS)
+
+    def draw(self, screen, weather):
+        mouse_pos = pygame.mouse.get_pos()
+        for label, rect in self.buttons.items():
+            color = BUTTON_HOVER_COLOR if rect.collidepoint(mouse_pos) else BUTTON_COLOR
+            pygame.draw.rect(screen, color, rect)
+            text = self.font.render(label, True, BUTTON_TEXT_COLOR)
+            screen.blit(text, text.get_rect(center=rect.center))
+
+        center = self.stick_center
+        pygame.draw.circle(screen, (100, 100, 100), (int(center.x), int(center.y)), STICK_RADIUS, 2)
+        knob = self.stick_knob_position
+        pygame.draw.circle(screen, (200, 200, 200), (int(knob.x), int(knob.y)), STICK_KNOB_RADIUS)
+
+        wind_vector = pygame.Vector2(weather.wind_vector())
+        if weather.enabled and wind_vector.length() > 0:
+            arrow_end = center + wind_vector * 100  # Scale wind vector for visibility
+            pygame.draw.line(screen, WHITE, center, arrow_end, 2)
+            pygame.draw.circle(screen, WHITE, (int(arrow_end.x), int(arrow_end.y)), 5)
+            text = f"Wind Direction: ({wind_vector.x:.2f}, {wind_vector.y:.2f})"
+            screen.blit(self.font.render(text, True, WHITE), (center.x - 150, center.y + 70))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the flocking simulation in a window.")
+    parser.add_argument("--boids", type=int, default=NUM_BOIDS, help="number of boids")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--world-width", type=int, default=WIDTH, help="world width (default: the window)")
+    parser.add_argument("--world-height", type=int, default=HEIGHT, help="world height (default: the window)")
+    parser.add_argument("--world-depth", type=int, default=None,
+                        help="world depth; simulates in 3D, seen from above")
+    parser.add_argument("--scene", default=None,
+                        help="JSON file of static obstacles (see flock_obstacles.py)")
+    parser.add_argument("--species", default=None, metavar="MIX",
+                        help=f"mix of species: one of {sorted(PRESETS)} or a JSON file "
+                             "(see flock_species.py)")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy",
+                        help="steering backend; numba steps without allocating arrays, for even "
+                             "frame times (falls back to numpy if not installed)")
+    parser.add_argument("--output", default=None, help="CSV file for per-frame metrics")
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="log memory allocated per frame and phase with the metrics (slow)")
+    parser.add_argument("--flush-interval", type=float, default=FLUSH_INTERVAL,
+                        help="seconds between background writes of the metrics file")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    obstacles = None
+    if args.scene:
+        obstacles = ObstacleField.from_scene(args.scene, args.world_width, args.world_height)
+    species = SpeciesMix.load(args.species) if args.species else None
+    try:
+        flock = Flock(args.boids, args.world_width, args.world_height, seed=args.seed,
+                      obstacles=obstacles, species=species, depth=args.world_depth,
+                      backend=args.backend, trace_allocations=args.trace_allocations)
+    except ValueError as error:
+        parser.error(str(error))
+    if flock.backend != args.backend:
+        print(f"Running the {flock.backend} backend: {args.backend} does not cover these options "
+              f"or is not installed", file=sys.stderr)
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Weather-Influenced Flocking Simulation")
+    weather = Weather(wind_direction=(0.0, 0.0))  # Stick starts centered
+    sinks = []
+    if args.output:
+        sinks.append(BufferedMetricsWriter(args.output, metrics_header(flock), args.flush_interval))
+    simulation = Simulation(flock, weather, sinks)
+    renderer = Renderer(WIDTH, HEIGHT, screen)
+    camera = Camera(flock.width, flock.height, WIDTH, HEIGHT, zoom=1.0)
+    panel = WeatherPanel(WIDTH, HEIGHT)
+    clock = pygame.time.Clock()
+    running = True
+    try:
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                panel.handle_button_click(event, weather)
+                panel.handle_stick_event(event, weather)
+                handle_camera_event(event, camera)
+            pan_with_keys(camera)
+            simulation.step()
+            renderer.draw(flock, weather, camera)
+            panel.draw(screen, weather)
+            pygame.display.flip()
+            clock.tick(FPS)
+    finally:
+        # Flush metrics still queued before the window goes away
+        flock.close()
+        for sink in sinks:
+            sink.close()
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# On-disk cache of run results, shared across sessions.
+#
+# Entries are addressed by the SHA-256 of the run parameters together with
+# ENGINE_VERSION and every constant of flock_engine (radii, weights, world
+# size, ...), so changing any of them simply misses. Each entry is a JSON
+# summary and, optionally, the full metrics log next to it. Reads refresh an
+# entry's modification time and writes evict the least recently used entries
+# once the cache grows past max_bytes.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import flock_engine
+
+DEFAULT_DIR = ".flock_cache"
+MAX_BYTES = 512 * 2 ** 20
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(2 ** 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def engine_constants():
+    return {name: value for name, value in vars(flock_engine).items()
+            if name.isupper() and isinstance(value, (int, float, str, tuple, list))}
+
+
+# kind separates simulation runs from other cached results, e.g. analyses
+def cache_key(params, kind="run"):
+    blob = json.dumps({"kind": kind, "engine": flock_engine.ENGINE_VERSION,
+                       "constants": engine_constants(), "params": params},
+                      sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_DIR, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.evict()
+
+    def _file(self, key, suffix):
+        return os.path.join(self.path, key + suffix)
+
+    # Summary stored for key, or None
+    def get(self, key):
+        summary_path = self._file(key, ".json")
+        try:
+            with open(summary_path) as file:
+                summary = json.load(file)
+        except (OSError, ValueError):
+            return None
+        self._touch(key)
+        return summary
+
+    # Path of the metrics log stored for key, or None
+    def log(self, key):
+        log_path = self._file(key, ".csv")
+        if not os.path.exists(log_path):
+            return None
+        self._touch(key)
+        return log_path
+
+    def put(self, key, summary, log_path=None):
+        if log_path is not None:
+            self._atomic_copy(log_path, self._file(key, ".csv"))
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(summary, file)
+            os.replace(temp, self._file(key, ".json"))
+        except BaseException:
+            os.remove(temp)
+            raise
+        self.evict()
+
+    def _touch(self, key):
+        for suffix in (".json", ".csv"):
+            try:
+                os.utime(self._file(key, suffix))
+            except OSError:
+                pass
+
+    def _atomic_copy(self, source, target):
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp)
+            os.replace(temp, target)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    # Drops least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = {}
+        for entry in os.scandir(self.path):
+            key, suffix = os.path.splitext(entry.name)
+            if suffix not in (".json", ".csv"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:  # Removed by another process meanwhile
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for suffix in (".json", ".csv"):
+                try:
+                    os.remove(self._file(key, suffix))
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,108 @@
+# Frame capture for exporting runs as image sequences or video.
+#
+# FrameRecorder.write() copies a rendered surface into one of a few
+# preallocated pixel buffers and queues it for a writer thread, so the
+# simulation only waits on disk when the writer has fallen a whole queue
+# behind. The writer saves PNG files, raw RGB24 files (width x height x 3
+# bytes, rows top to bottom), or pipes raw frames to ffmpeg when the path has
+# a video suffix.
+#
+# Example:
+#   python flock_sim.py --boids 500 --steps 900 --snow 2 --record frames/
+#   python flock_sim.py --boids 500 --steps 900 --snow 2 --record run.mp4
+
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+import pygame
+
+from flock_render import FPS
+
+FRAME_FORMATS = ("png", "raw", "video")
+VIDEO_SUFFIXES = (".mp4", ".mkv", ".webm", ".avi", ".mov")
+QUEUE_SIZE = 8  # Frames buffered between the simulation and the writer
+
+
+def frame_format_for(path):
+    if os.path.splitext(path)[1].lower() in VIDEO_SUFFIXES:
+        return "video"
+    return "png"
+
+
+class FrameRecorder:
+    def __init__(self, path, size, frame_format=None, fps=FPS, queue_size=QUEUE_SIZE):
+        self.frame_format = frame_format or frame_format_for(path)
+        if self.frame_format not in FRAME_FORMATS:
+            raise ValueError(f"unknown frame format {self.frame_format!r}, expected one of {FRAME_FORMATS}")
+        self.path = path
+        self.width, self.height = size
+        self.frames = 0
+        self.error = None
+        self.encoder = None
+        if self.frame_format == "video":
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg is None:
+                raise RuntimeError("video export needs ffmpeg on PATH; record png or raw frames instead")
+            self.encoder = subprocess.Popen(
+                [ffmpeg, "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                 "-s", f"{self.width}x{self.height}", "-r", str(fps), "-i", "-",
+                 "-pix_fmt", "yuv420p", path],
+                stdin=subprocess.PIPE)
+        else:
+            os.makedirs(path, exist_ok=True)
+        # Buffers are (width, height, 3) like pygame.surfarray
+        self.free = queue.Queue()
+        for _ in range(queue_size):
+            self.free.put(np.empty((self.width, self.height, 3), dtype=np.uint8))
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="frame-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, surface):
+        if self.error is not None:
+            raise self.error
+        buffer = self.free.get()
+        pixels = pygame.surfarray.pixels3d(surface)
+        np.copyto(buffer, pixels)
+        del pixels  # Unlocks the surface
+        self.pending.put((self.frames, buffer))
+        self.frames += 1
+
+    def close(self):
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+        if self.encoder is not None:
+            self.encoder.stdin.close()
+            self.encoder.wait()
+            self.encoder = None
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            index, buffer = item
+            if self.error is None:
+                try:
+                    self._save(index, buffer)
+                except (OSError, pygame.error) as error:
+                    self.error = error
+            self.free.put(buffer)
+
+    def _save(self, index, buffer):
+        if self.frame_format == "png":
+            frame = pygame.surfarray.make_surface(buffer)
+            pygame.image.save(frame, os.path.join(self.path, f"frame_{index:06d}.png"))
+            return
+        rows = np.ascontiguousarray(buffer.transpose(1, 0, 2))
+        if self.frame_format == "raw":
+            rows.tofile(os.path.join(self.path, f"frame_{index:06d}.rgb"))
+        else:
+            self.encoder.stdin.write(rows.data)
@@ -0,0 +1,247 @@
+# Job queue over TCP for spreading sweeps across machines.
+#
+# A Coordinator serves a list of jobs (JSON values) to workers that connect
+# to it, one JSON message per line. A worker asks for a job, runs it and
+# reports the result or the error, then asks for the next one, until the
+# coordinator says it is done or goes away; more workers, on any host, just
+# take jobs off the same queue. A job is handed out again when its run
+# fails, when the worker holding it disconnects or, with a lease, when it has
+# been out for longer than lease seconds; once a job has been handed out
+# attempts times without a result the whole queue stops with its last error.
+# The first result of each job counts and later duplicates are dropped.
+#
+# Messages from a worker, each answered with one line:
+#   {"op": "job"}       -> {"op": "run", "job": 3, "data": ...},
+#                          {"op": "wait", "seconds": 1.0} while every job is
+#                          out but some may still come back, or {"op": "done"}
+#   {"op": "result", "job": 3, "data": ...}        -> {"ok": true}
+#   {"op": "failed", "job": 3, "error": "..."}     -> {"ok": true}
+#
+# There is no authentication: serve on localhost, or on a trusted network
+# only. flock_sweep.py --serve and --worker are the command line front end.
+
+import asyncio
+import json
+import socket
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8767
+ATTEMPTS = 3             # Times a job is handed out before the queue gives up
+WAIT = 1.0               # Seconds a worker waits before asking again while every job is out
+CONNECT_TIMEOUT = 30.0   # Seconds a worker keeps trying to reach the coordinator
+CONNECT_RETRY = 0.5
+MESSAGE_LIMIT = 2 ** 28  # Longest message line, which may carry a whole metrics log
+
+
+# "host:port" or "port" as a (host, port) pair, for argparse
+def address(value):
+    host, _, port = value.rpartition(":")
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"expected [HOST:]PORT, got {value!r}") from None
+    return host or DEFAULT_HOST, port
+
+
+class Coordinator:
+    # on_result(job, data) is called with the first result of every job, in
+    # the order they arrive
+    def __init__(self, jobs, host=DEFAULT_HOST, port=DEFAULT_PORT, attempts=ATTEMPTS, lease=None,
+                 on_result=None):
+        self.jobs = list(jobs)
+        self.attempts = max(1, attempts)
+        self.lease = lease
+        self.on_result = on_result
+        self.pending = deque(range(len(self.jobs)))
+        self.tries = [0] * len(self.jobs)
+        self.deadlines = {}  # Jobs out with a worker, with their lease deadline or None
+        self.results = [None] * len(self.jobs)
+        self.done = [False] * len(self.jobs)
+        self.remaining = len(self.jobs)
+        self.error = None
+        # Bound here so a busy port fails at once and port 0 gets its number
+        self.socket = socket.create_server((host, port))
+        self.host, self.port = self.socket.getsockname()[:2]
+
+    # Serves until every job has a result; returns the results in job order
+    # or raises RuntimeError once a job has failed too often
+    def run(self):
+        try:
+            if self.remaining:
+                asyncio.run(self._run())
+        finally:
+            self.socket.close()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return list(self.results)
+
+    async def _run(self):
+        self.finished = asyncio.Event()
+        self.handlers = {}  # Connection handler tasks and their writers
+        server = await asyncio.start_server(self._serve, sock=self.socket, limit=MESSAGE_LIMIT)
+        reaper = asyncio.create_task(self._expire_leases()) if self.lease else None
+        await self.finished.wait()
+        server.close()
+        if reaper is not None:
+            reaper.cancel()
+        # Hanging up tells the workers that are left there is nothing more
+        for writer in self.handlers.values():
+            writer.close()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        await server.wait_closed()
+
+    def _stop(self, error=None):
+        if error is not None and self.error is None:
+            self.error = error
+        self.finished.set()
+
+    def _hand_out(self):
+        job = self.pending.popleft()
+        self.tries[job] += 1
+        self.deadlines[job] = time.monotonic() + self.lease if self.lease else None
+        return job
+
+    # A job came back without a result; queue it again unless it is used up
+    def _retry(self, job, error):
+        if self.finished.is_set() or self.done[job] or job not in self.deadlines:
+            return
+        del self.deadlines[job]
+        if self.tries[job] >= self.attempts:
+            self._stop(f"job {job} failed {self.tries[job]} times, last with: {error}")
+        else:
+            self.pending.append(job)
+
+    def _finish(self, job, data):
+        if self.done[job]:
+            return
+        self.done[job] = True
+        self.results[job] = data
+        self.deadlines.pop(job, None)
+        if job in self.pending:  # Requeued after its lease ran out
+            self.pending.remove(job)
+        self.remaining -= 1
+        if self.on_result is not None:
+            try:
+                self.on_result(job, data)
+            except Exception as error:
+                self._stop(f"storing the result of job {job} failed: {error!r}")
+                return
+        if self.remaining == 0:
+            self._stop()
+
+    def _job(self, message):
+        job = message.get("job")
+        if isinstance(job, bool) or not isinstance(job, int) or not 0 <= job < len(self.jobs):
+            raise ValueError(f"unknown job {job!r}")
+        return job
+
+    def _reply(self, message, held):
+        op = message.get("op") if isinstance(message, dict) else None
+        if op == "job":
+            if self.finished.is_set():
+                return {"op": "done"}
+            if not self.pending:
+                return {"op": "wait", "seconds": WAIT}
+            job = self._hand_out()
+            held.add(job)
+            return {"op": "run", "job": job, "data": self.jobs[job]}
+        if op == "result":
+            job = self._job(message)
+            held.discard(job)
+            self._finish(job, message.get("data"))
+            return {"ok": True}
+        if op == "failed":
+            job = self._job(message)
+            held.discard(job)
+            self._retry(job, message.get("error"))
+            return {"ok": True}
+        raise ValueError(f"unknown op {op!r}")
+
+    async def _serve(self, reader, writer):
+        self.handlers[asyncio.current_task()] = writer
+        held = set()  # Jobs this worker has and has not reported on
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    reply = self._reply(json.loads(line), held)
+                except ValueError as error:
+                    reply = {"ok": False, "error": str(error)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass  # Dropped, or sent a line over MESSAGE_LIMIT
+        finally:
+            self.handlers.pop(asyncio.current_task(), None)
+            for job in held:
+                self._retry(job, "worker disconnected")
+            writer.close()
+
+    async def _expire_leases(self):
+        while True:
+            await asyncio.sleep(min(self.lease, 1.0))
+            now = time.monotonic()
+            for job, deadline in list(self.deadlines.items()):
+                if deadline is not None and deadline < now:
+                    self._retry(job, f"no result within the {self.lease} s lease")
+
+
+def connect(host, port, timeout=CONNECT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(CONNECT_RETRY)
+
+
+# One message to the coordinator and its reply, or None once it has gone
+def request(stream, message):
+    try:
+        stream.write(json.dumps(message) + "\n")
+        stream.flush()
+        line = stream.readline()
+    except OSError:
+        return None
+    return json.loads(line) if line else None
+
+
+# Runs jobs from the coordinator at host:port through run(data), which
+# returns the result data, until the coordinator is done or gone; returns
+# the number of jobs this worker finished
+def work(host, port, run, connect_timeout=CONNECT_TIMEOUT):
+    finished = 0
+    with connect(host, port, connect_timeout) as connection, \
+            connection.makefile("rw", encoding="utf-8", newline="\n") as stream:
+        while True:
+            reply = request(stream, {"op": "job"})
+            if reply is None or reply.get("op") == "done":
+                return finished
+            if reply.get("op") == "wait":
+                time.sleep(reply["seconds"])
+                continue
+            job = reply["job"]
+            try:
+                message = {"op": "result", "job": job, "data": run(reply["data"])}
+            except Exception:
+                error = traceback.format_exc().strip().splitlines()[-1]
+                message = {"op": "failed", "job": job, "error": error}
+            if request(stream, message) is None:
+                return finished
+            finished += message["op"] == "result"
+
+
+# processes workers pulling from the same coordinator on this machine
+def run_workers(host, port, run, processes=1, connect_timeout=CONNECT_TIMEOUT):
+    if processes <= 1:
+        return work(host, port, run, connect_timeout)
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(work, host, port, run, connect_timeout) for _ in range(processes)]
+        return sum(future.result() for future in futures)
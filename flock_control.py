@@ -0,0 +1,243 @@
+# Remote control of a running simulation.
+#
+# ControlServer accepts JSON commands, one per line, from TCP clients on
+# localhost and answers each with one JSON line. Commands are checked on the
+# server thread and handed to the Controller through a deque, which the
+# simulation drains between steps, so a step never waits on a client and a
+# command never lands in the middle of one.
+#
+# Commands:
+#   {"op": "set", "wind_level": 2, "snow_level": 1, "fog_level": 0,
+#    "wind_direction": [0, 1], "weather_enabled": true, "boids": 500}
+#       any subset of the fields; levels are indices in LEVELS and
+#       wind_direction may be [x, y, z] for a 3D flock
+#   {"op": "pause"}, {"op": "resume"}
+#   {"op": "step", "count": 10}   run count steps while paused
+#   {"op": "status"}              current step, flock size and weather
+#
+# From a shell:
+#   python flock_sim.py --steps 100000 --control &
+#   python flock_control.py '{"op": "set", "snow_level": 3}'
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import threading
+from collections import deque
+
+from flock_engine import LEVELS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+LEVEL_FIELDS = ("wind_level", "snow_level", "fog_level")
+
+
+def _level(value):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < len(LEVELS):
+        raise ValueError(f"level must be an integer between 0 and {len(LEVELS) - 1}")
+    return value
+
+
+def _count(value, minimum):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f"expected an integer of at least {minimum}, got {value!r}")
+    return value
+
+
+# Unit-length at most, like the wind stick of the pygame scripts
+def _direction(value):
+    try:
+        direction = tuple(float(v) for v in value)
+    except (TypeError, ValueError):
+        direction = ()
+    if len(direction) not in (2, 3):
+        raise ValueError(f"wind_direction must be [x, y] or [x, y, z], got {value!r}")
+    length = math.hypot(*direction)
+    if not math.isfinite(length):
+        raise ValueError(f"wind_direction must be finite, got {value!r}")
+    if length > 1:
+        direction = tuple(v / length for v in direction)
+    return direction
+
+
+# Returns the command with its fields checked, or raises ValueError
+def validate(command):
+    if not isinstance(command, dict):
+        raise ValueError("command must be a JSON object")
+    op = command.get("op")
+    if op == "set":
+        checked = {"op": "set"}
+        for key, value in command.items():
+            if key in LEVEL_FIELDS:
+                checked[key] = _level(value)
+            elif key == "wind_direction":
+                checked[key] = _direction(value)
+            elif key == "weather_enabled":
+                if not isinstance(value, bool):
+                    raise ValueError("weather_enabled must be true or false")
+                checked[key] = value
+            elif key == "boids":
+                checked[key] = _count(value, 1)
+            elif key != "op":
+                raise ValueError(f"unknown field {key!r}")
+        return checked
+    if op in ("pause", "resume"):
+        return {"op": op}
+    if op == "step":
+        return {"op": "step", "count": _count(command.get("count", 1), 1)}
+    raise ValueError(f"unknown op {op!r}")
+
+
+# Applies queued commands to a Simulation between steps
+class Controller:
+    def __init__(self):
+        self.commands = deque()
+        self.wakeup = threading.Event()
+        self.paused = False
+        self.single_steps = 0
+
+    # Called from any thread
+    def submit(self, command):
+        self.commands.append(validate(command))
+        self.wakeup.set()
+
+    # Called by the simulation before every step; returns at once unless
+    # paused, in which case it waits for resume or step
+    def apply(self, simulation):
+        while True:
+            while self.commands:
+                self.execute(self.commands.popleft(), simulation)
+            if not self.paused:
+                return
+            if self.single_steps:
+                self.single_steps -= 1
+                return
+            self.wakeup.wait()
+            self.wakeup.clear()
+
+    def execute(self, command, simulation):
+        op = command["op"]
+        if op == "set":
+            weather = simulation.weather
+            for key in LEVEL_FIELDS:
+                if key in command:
+                    setattr(weather, key, command[key])
+            if "wind_direction" in command:
+                weather.wind_direction = command["wind_direction"]
+            if "weather_enabled" in command:
+                weather.enabled = command["weather_enabled"]
+            if "boids" in command:
+                simulation.flock.resize(command["boids"])
+        elif op == "pause":
+            self.paused = True
+        elif op == "resume":
+            self.paused = False
+            self.single_steps = 0
+        elif op == "step":
+            self.single_steps += command["count"]
+
+
+def status(simulation, controller):
+    weather = simulation.weather
+    return {"step": simulation.steps, "boids": len(simulation.flock),
+            "paused": controller.paused, "wind_level": weather.wind_level,
+            "snow_level": weather.snow_level, "fog_level": weather.fog_level,
+            "wind_direction": list(weather.wind_direction),
+            "weather_enabled": weather.enabled}
+
+
+class ControlServer:
+    def __init__(self, simulation, controller, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self.simulation = simulation
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="control", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stop.set)
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.stop = asyncio.Event()
+        self.handlers = set()
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve, self.host, self.port))
+        except OSError as error:
+            self.error = error
+            self.started.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_until_complete(self._wait_closed())
+        self.loop.close()
+
+    async def _wait_closed(self):
+        await self.stop.wait()
+        self.server.close()
+        for handler in self.handlers:
+            handler.cancel()
+        await self.server.wait_closed()
+
+    def _reply(self, line):
+        try:
+            command = json.loads(line)
+            if isinstance(command, dict) and command.get("op") == "status":
+                return {"ok": True, **status(self.simulation, self.controller)}
+            self.controller.submit(command)
+        except ValueError as error:
+            return {"ok": False, "error": str(error)}
+        return {"ok": True}
+
+    async def _serve(self, reader, writer):
+        self.handlers.add(asyncio.current_task())
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                writer.write(json.dumps(self._reply(line)).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+
+# Blocking client: sends one command and returns the reply
+def send(command, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(json.dumps(command).encode() + b"\n")
+        with connection.makefile("r") as lines:
+            return json.loads(lines.readline())
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Send commands to a running simulation.")
+    parser.add_argument("commands", nargs="*", type=json.loads, default=[{"op": "status"}],
+                        metavar="COMMAND", help='JSON command, e.g. \'{"op": "pause"}\' (default: status)')
+    parser.add_argument("--host", default=DEFAULT_HOST, help="control server address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="control server port")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for command in args.commands:
+        print(json.dumps(send(command, args.host, args.port)))
+
+
+if __name__ == "__main__":
+    main()
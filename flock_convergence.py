@@ -0,0 +1,68 @@
+# Early stopping once chosen metrics stop changing.
+#
+# Convergence is a metrics sink. It keeps running sums of the last two
+# windows of every watched metric, and a metric counts as settled when the
+# mean of the latest window differs from the mean of the window before it by
+# less than threshold, relative to the latest mean. Once all watched metrics
+# have been settled for patience steps in a row the run has converged and
+# reason says when and why.
+
+from collections import deque
+
+WINDOW = 30      # Steps per window, one second at 30 FPS
+THRESHOLD = 1e-3  # Relative change between consecutive window means
+PATIENCE = 30    # Consecutive settled steps needed to stop
+
+
+class Convergence:
+    def __init__(self, header, metrics, window=WINDOW, threshold=THRESHOLD, patience=PATIENCE):
+        unknown = [name for name in metrics if name not in header]
+        if unknown:
+            raise ValueError(f"unknown metrics {unknown}, expected some of {list(header)}")
+        if window < 1 or patience < 1:
+            raise ValueError("window and patience must be at least 1")
+        self.metrics = list(metrics)
+        self.columns = [list(header).index(name) for name in metrics]
+        self.window = window
+        self.threshold = threshold
+        self.patience = patience
+        self.history = deque()
+        self.recent = [0.0] * len(metrics)    # Sums over the latest window
+        self.previous = [0.0] * len(metrics)  # Sums over the window before it
+        self.changes = [float("inf")] * len(metrics)
+        self.settled = 0
+        self.steps = 0
+        self.reason = None
+
+    @property
+    def converged(self):
+        return self.reason is not None
+
+    def write(self, row):
+        self.steps += 1
+        values = [float(row[column]) for column in self.columns]
+        history = self.history
+        history.append(values)
+        for k, value in enumerate(values):
+            self.recent[k] += value
+        if len(history) > self.window:
+            middle = history[-self.window - 1]
+            for k, value in enumerate(middle):
+                self.recent[k] -= value
+                self.previous[k] += value
+        if len(history) > 2 * self.window:
+            for k, value in enumerate(history.popleft()):
+                self.previous[k] -= value
+        if len(history) < 2 * self.window:
+            return
+        # Same window length, so the ratio of sums is the ratio of means
+        self.changes = [abs(recent - previous) / max(abs(recent), 1e-300)
+                        for recent, previous in zip(self.recent, self.previous)]
+        self.settled = self.settled + 1 if max(self.changes) < self.threshold else 0
+        if self.settled >= self.patience and self.reason is None:
+            changes = ", ".join(f"{name} {change:.2g}" for name, change in zip(self.metrics, self.changes))
+            self.reason = (f"converged at step {self.steps}: relative change per {self.window} steps "
+                           f"below {self.threshold:g} for {self.patience} steps ({changes})")
+
+    def close(self):
+        pass
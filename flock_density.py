@@ -0,0 +1,57 @@
+# Occupancy and centroid grid for crowd avoidance and the Density metric.
+#
+# Boids are binned once per step into cells of side sqrt(pi) * radius / 3, so
+# a 3x3 block of cells covers the same area as a circle of the given radius
+# (in 3D, a 3x3x3 block of cubes has the volume of the sphere). A box filter
+# over the per-cell counts and position sums then gives, for every cell, how
+# many boids are in the surrounding block and where their centroid is, and
+# each boid looks its crowd up from its own cell.
+
+import itertools
+
+import numpy as np
+
+
+# Sum of every 3x3 (or 3x3x3) block of a grid, zero outside the edges
+def box3(grid):
+    padded = np.pad(grid, 1)
+    return sum(padded[tuple(slice(o, o + size) for o, size in zip(offset, grid.shape))]
+               for offset in itertools.product(range(3), repeat=grid.ndim))
+
+
+# Side of the cells for a crowd of the given radius
+def field_cell_size(radius, dims=2):
+    if dims == 2:
+        return np.sqrt(np.pi) * radius / 3
+    return np.cbrt(4 * np.pi / 3) * radius / 3
+
+
+# cell_offset, if given, moves every boid by a whole number of cells along
+# each axis before binning, while the crowd sums still add up positions.
+class DensityField:
+    def __init__(self, positions, radius, width, height, depth=None, cell_offset=None):
+        extents = (width, height) if depth is None else (width, height, depth)
+        self.cell_size = field_cell_size(radius, len(extents))
+        shape = [max(1, int(np.ceil(extent / self.cell_size))) for extent in extents]
+        self.cell = np.zeros(len(positions), dtype=np.int64)
+        for axis in reversed(range(len(shape))):
+            coord = positions[:, axis] // self.cell_size
+            if cell_offset is not None:
+                coord = coord + cell_offset[:, axis]
+            coord = np.clip(coord, 0, shape[axis] - 1).astype(np.int32)
+            self.cell = self.cell * shape[axis] + coord
+        # Grids are indexed [z,] y, x, so cell ids run along x first
+        grid_shape = shape[::-1]
+        cells = int(np.prod(shape))
+        self.occupancy = np.bincount(self.cell, minlength=cells).reshape(grid_shape)
+        self.counts = box3(self.occupancy).ravel()
+        self.sums = np.stack([box3(np.bincount(self.cell, weights=positions[:, k],
+                                               minlength=cells).reshape(grid_shape)).ravel()
+                              for k in range(positions.shape[1])], axis=1)
+        self.positions = positions
+
+    # Number of other boids around each boid in rows and the sum of their
+    # positions
+    def crowd(self, rows=slice(None)):
+        cell = self.cell[rows]
+        return self.counts[cell] - 1, self.sums[cell] - self.positions[rows]
@@ -0,0 +1,843 @@
+# Array-based flocking engine.
+#
+# Holds the whole flock as NumPy arrays and applies the same rules as the
+# Boid class in boids_Overcrowding_Collision_Avoidance_snow.py (alignment,
+# cohesion, separation, crowd avoidance, wind, snow slow-down and wrap-around)
+# to every boid at once. Neighbors are found through a uniform cell grid, so
+# each boid only tests the boids in its own and the eight surrounding cells.
+#
+# Boids are updated synchronously from the previous step's state, whereas the
+# pygame scripts update them one after another in place.
+#
+# The same code runs in 3D when the world is given a depth: positions and
+# velocities get a z component (up is +z), cells become cubes, wind may blow
+# vertically and snow drags boids down.
+
+import contextlib
+import functools
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from flock_density import DensityField
+from flock_memory import AllocationTracer
+from flock_quadtree import DEFAULT_THETA, QuadTree
+
+# World dimensions; a 3D world also has a depth
+WIDTH, HEIGHT = 1200, 800
+
+# Boid parameters
+NUM_BOIDS = 50
+BASE_SPEED = 2  # Base speed without weather influence
+MIN_SPEED = 0.1
+VIEW_RADIUS = 50
+MIN_VIEW_RADIUS = 10  # Fog never shrinks the view below this
+SEPARATION_DISTANCE = 20
+CROWD_THRESHOLD = 5  # Maximum number of boids in the local area before moving away
+CROWD_RADIUS = 30    # Radius to check for crowding
+
+# Rule weights
+ALIGNMENT_WEIGHT = 0.05
+COHESION_WEIGHT = 0.01
+SEPARATION_WEIGHT = 0.1
+CROWD_WEIGHT = 0.05
+WIND_WEIGHT = 0.1
+SNOW_SLOWDOWN = 0.5  # Reduce speed by up to 50% for heavy snow
+SNOW_FALL = 0.05     # Downward pull of heavy snow per step in 3D
+
+# Weather levels
+LEVELS = [0.0, 0.3, 0.6, 1.0]
+LEVEL_NAMES = ["None", "Light", "Medium", "Strong"]
+
+# Ways boids find the neighbors they align and cohere with
+INTERACTIONS = ("grid", "quadtree", "topological")
+
+# Steering backends; "numba" runs the grid interaction as one compiled kernel
+# and falls back to "numpy" when Numba is not installed
+BACKENDS = ("numpy", "numba")
+
+# Grid steering is split over a thread pool only when every chunk gets at
+# least this many boids; smaller flocks run on the calling thread
+MIN_CHUNK_SIZE = 2048
+
+# Where crowd avoidance and Density get their crowd from: exact pairs within
+# CROWD_RADIUS, or the per-step occupancy grid (flock_density.DensityField)
+CROWDINGS = ("pairs", "field")
+
+# Topological interaction: number of nearest neighbors each boid responds to
+TOPOLOGICAL_NEIGHBORS = 7
+MIN_TOPOLOGICAL_NEIGHBORS = 2  # Fog never reduces k below this
+
+# Cell, boid and pair indices; 32 bits keep million-boid buffers compact
+INDEX_DTYPE = np.int32
+
+# Lower edges of the neighbor-count histogram bins (last bin is open-ended)
+HISTOGRAM_EDGES = (0, 1, 2, 4, 8, 16, 32)
+
+# Times a boid spawned inside an obstacle is placed again before giving up
+SPAWN_ATTEMPTS = 100
+
+# Bump whenever a change alters simulation results, so that runs cached by
+# flock_cache.py under an older engine are not reused
+ENGINE_VERSION = 1
+
+
+# Extent of the world along each axis
+def world_size(width, height, depth=None):
+    return (width, height) if depth is None else (width, height, depth)
+
+
+# Cell offsets that visit each pair of neighboring cells once: the own cell
+# and every offset whose last nonzero component is positive. In 2D:
+# (0, 0), (1, 0), (-1, 1), (0, 1), (1, 1).
+def half_stencil(dims):
+    stencil = []
+    for offset in itertools.product((-1, 0, 1), repeat=dims):
+        offset = offset[::-1]
+        nonzero = [o for o in offset if o]
+        if not nonzero or nonzero[-1] > 0:
+            stencil.append(offset)
+    return stencil
+
+
+# Length of every row of vectors
+def lengths(vectors):
+    if vectors.shape[1] == 2:
+        return np.hypot(vectors[:, 0], vectors[:, 1])
+    return np.sqrt((vectors ** 2).sum(axis=1))
+
+
+def adjusted_view_radius(fog_density, view_radius=VIEW_RADIUS):
+    return max(MIN_VIEW_RADIUS, view_radius * (1 - fog_density))
+
+
+def adjusted_neighbor_count(fog_density, neighbors=TOPOLOGICAL_NEIGHBORS):
+    return max(MIN_TOPOLOGICAL_NEIGHBORS, int(round(neighbors * (1 - fog_density))))
+
+
+# Sum rows of values into n buckets given by index
+def sum_by(index, values, n):
+    return np.stack([np.bincount(index, weights=values[:, k], minlength=n)
+                     for k in range(values.shape[1])], axis=1)
+
+
+# Per-step neighbor interaction counters
+class NeighborStats:
+    HEADER = ["Pair Checks", "View Neighbors", "Crowd Neighbors",
+              "Separation Neighbors", "View Neighbor Histogram"]
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.pair_checks = 0
+        self.view_neighbors = 0
+        self.crowd_neighbors = 0
+        self.separation_neighbors = 0
+        self.histogram = np.zeros(len(HISTOGRAM_EDGES), dtype=np.int64)
+
+    def record(self, pair_checks, view_counts, crowd_counts, separation_counts):
+        self.pair_checks += int(pair_checks)
+        self.view_neighbors += int(view_counts.sum())
+        self.crowd_neighbors += int(crowd_counts.sum())
+        self.separation_neighbors += int(separation_counts.sum())
+        bins = np.searchsorted(HISTOGRAM_EDGES, view_counts, side="right") - 1
+        self.histogram += np.bincount(bins, minlength=len(HISTOGRAM_EDGES))
+
+    @staticmethod
+    def histogram_labels():
+        labels = []
+        for low, high in zip(HISTOGRAM_EDGES, HISTOGRAM_EDGES[1:] + (None,)):
+            if high is None:
+                labels.append(f"{low}+")
+            elif high - low == 1:
+                labels.append(str(low))
+            else:
+                labels.append(f"{low}-{high - 1}")
+        return labels
+
+    def as_row(self):
+        histogram = "|".join(str(int(count)) for count in self.histogram)
+        return [self.pair_checks, self.view_neighbors, self.crowd_neighbors,
+                self.separation_neighbors, histogram]
+
+
+# Uniform cell grid over the world, rebuilt from the positions every step.
+# Cells are numbered along x first, then y, then z.
+class CellGrid:
+    def __init__(self, positions, cell_size, width, height, depth=None):
+        self.cell_size = float(cell_size)
+        self.shape = [max(1, int(np.ceil(extent / self.cell_size)))
+                      for extent in world_size(width, height, depth)]
+        self.cols, self.rows = self.shape[:2]
+        self.layers = self.shape[2] if len(self.shape) > 2 else 1
+        self.strides = [int(np.prod(self.shape[:axis])) for axis in range(len(self.shape))]
+        # Cell coordinate of every boid along each axis
+        self.coords = [np.clip(positions[:, axis] // self.cell_size, 0, size - 1).astype(INDEX_DTYPE)
+                       for axis, size in enumerate(self.shape)]
+        self.cell_ids = sum(coord * stride for coord, stride in zip(self.coords, self.strides))
+        self.order = np.argsort(self.cell_ids, kind="stable").astype(INDEX_DTYPE)
+        self.counts = np.bincount(self.cell_ids, minlength=int(np.prod(self.shape))).astype(INDEX_DTYPE)
+        self.starts = (np.cumsum(self.counts) - self.counts).astype(INDEX_DTYPE)
+
+    @property
+    def dims(self):
+        return len(self.shape)
+
+    # All (i, j) pairs, i in src, with j in the (2 * ring + 1)^dims block of
+    # cells around i's cell (or the given cell offsets), i != j
+    def block_pairs(self, src, ring=1, stencil=None):
+        if stencil is None:
+            stencil = itertools.product(range(-ring, ring + 1), repeat=self.dims)
+        own = [coord[src] for coord in self.coords]
+        pairs_i, pairs_j = [], []
+        for offset in stencil:
+            valid = np.ones(len(src), dtype=bool)
+            cells = 0
+            for coord, o, size, stride in zip(own, offset, self.shape, self.strides):
+                neighbor = coord + o
+                valid &= (neighbor >= 0) & (neighbor < size)
+                cells = cells + neighbor * stride
+            cells = cells[valid]
+            counts = self.counts[cells]
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            pairs_i.append(np.repeat(src[valid], counts))
+            pairs_j.append(self.order[np.repeat(self.starts[cells], counts) + offsets])
+        if not pairs_i:
+            empty = np.zeros(0, dtype=INDEX_DTYPE)
+            return empty, empty
+        i = np.concatenate(pairs_i)
+        j = np.concatenate(pairs_j)
+        keep = i != j
+        return i[keep], j[keep]
+
+    def candidate_pairs(self):
+        return self.block_pairs(np.arange(len(self.order), dtype=INDEX_DTYPE))
+
+    # Boids in the cells overlapping the rectangle x0 <= x < x1, y0 <= y < y1,
+    # at any height; each row of those cells is one contiguous run of order
+    def boids_in(self, x0, y0, x1, y1):
+        cx0 = max(int(x0 // self.cell_size), 0)
+        cx1 = min(int(x1 // self.cell_size), self.cols - 1)
+        cy0 = max(int(y0 // self.cell_size), 0)
+        cy1 = min(int(y1 // self.cell_size), self.rows - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        rows = np.arange(cy0, cy1 + 1)[None, :] + self.rows * np.arange(self.layers)[:, None]
+        first = rows.ravel() * self.cols + cx0
+        last = first + (cx1 - cx0)
+        begin = self.starts[first].tolist()
+        end = (self.starts[last] + self.counts[last]).tolist()
+        return np.concatenate([self.order[b:e] for b, e in zip(begin, end)])
+
+    # Every unordered candidate pair once: the own cell plus the four
+    # neighboring cells ahead of it
+    def half_pairs(self):
+        i, j = self.block_pairs(np.arange(len(self.order), dtype=INDEX_DTYPE),
+                                stencil=half_stencil(self.dims))
+        keep = (self.cell_ids[i] != self.cell_ids[j]) | (i < j)
+        return i[keep], j[keep]
+
+
+# Pairs closer than radius as (i, j, offset j - i, distance, pairs tested)
+# With rows (a slice or index array), only those boids are paired and i
+# numbers them in rows order.
+def grid_pairs(positions, radius, width, height, grid=None, rows=None, depth=None):
+    if grid is None:
+        grid = CellGrid(positions, radius, width, height, depth)
+    if rows is None:
+        i, j = grid.candidate_pairs()
+        local = None
+    else:
+        src = np.arange(len(positions), dtype=INDEX_DTYPE)[rows]
+        i, j = grid.block_pairs(src)
+        local = np.empty(len(positions), dtype=INDEX_DTYPE)
+        local[src] = np.arange(len(src))
+    offset = positions[j] - positions[i]
+    distance = np.sqrt((offset ** 2).sum(axis=1))
+    keep = distance < radius
+    i = i[keep] if local is None else local[i[keep]]
+    return i, j[keep], offset[keep], distance[keep], len(keep)
+
+
+# Verlet neighbor list: pairs within reach + skin, kept across steps and
+# rebuilt only once some boid has moved more than skin / 2 since the last
+# build. Until then no pair closer than reach can be missing from the list,
+# so each step only recomputes distances for the cached pairs and filters
+# them by radius. Each pair is stored once (i < j) and mirrored after
+# filtering. A boid that wraps around an edge lands among different
+# neighbors, so only its own pairs are searched again. With check set every
+# step also runs grid_pairs and raises RuntimeError if the list missed a pair.
+class VerletList:
+    def __init__(self, skin, check=False):
+        self.skin = float(skin)
+        self.check = check
+        self.reach = None
+        self.reference = None
+        self.builds = 0
+
+    def build(self, positions, reach, width, height, depth=None):
+        cutoff = reach + self.skin
+        i, j = CellGrid(positions, cutoff, width, height, depth).half_pairs()
+        offset = positions[j] - positions[i]
+        close = lengths(offset) < cutoff
+        self.i, self.j = i[close], j[close]
+        self.reach = reach
+        self.reference = positions.copy()
+        self.builds += 1
+        return len(i)
+
+    # Replace the pairs of the given boids by a cell grid search of their
+    # rows alone, so memory follows their local neighbors; only a handful of
+    # boids wrap in any one step. Their partners keep their older references
+    # and may already be skin / 2 away from them, so until the next build a
+    # pair can close by skin / 2 (the refreshed boid) plus skin (the partner,
+    # from one side of its reference to the other): the search reaches
+    # 1.5 skin past reach to stay exact.
+    def refresh(self, positions, boids, width, height, depth=None):
+        cutoff = self.reach + 1.5 * self.skin
+        row, fj, _, _, pair_checks = grid_pairs(positions, cutoff, width, height, rows=boids,
+                                                depth=depth)
+        fi = boids[row]
+        stale = np.zeros(len(positions), dtype=bool)
+        stale[boids] = True
+        keep = ~(stale[self.i] | stale[self.j])
+        # Pairs between two refreshed boids are found in both directions
+        once = (fi != fj) & (~stale[fj] | (fi < fj))
+        self.i = np.concatenate([self.i[keep], fi[once]])
+        self.j = np.concatenate([self.j[keep], fj[once]])
+        self.reference[boids] = positions[boids]
+        return pair_checks
+
+    def pairs(self, positions, radius, reach, width, height, depth=None):
+        if self.reference is None or reach != self.reach or len(positions) != len(self.reference):
+            pair_checks = self.build(positions, reach, width, height, depth)
+        else:
+            size = np.array(world_size(width, height, depth), dtype=positions.dtype)
+            moved = positions - self.reference
+            travelled = moved - size * np.round(moved / size)
+            wrapped = np.nonzero((np.abs(moved - travelled) > 0.5 * size).any(axis=1))[0]
+            if ((travelled ** 2).sum(axis=1).max(initial=0) > (self.skin / 2) ** 2
+                    or len(wrapped) > len(positions) // 20):
+                pair_checks = self.build(positions, reach, width, height, depth)
+            elif len(wrapped):
+                pair_checks = self.refresh(positions, wrapped, width, height, depth)
+            else:
+                pair_checks = 0
+        offset = positions[self.j] - positions[self.i]
+        distance = lengths(offset)
+        keep = distance < radius
+        i, j, offset, distance = self.i[keep], self.j[keep], offset[keep], distance[keep]
+        if self.check:
+            self.compare(positions, radius, i, j, width, height, depth)
+        return (np.concatenate([i, j]), np.concatenate([j, i]), np.concatenate([offset, -offset]),
+                np.concatenate([distance, distance]), pair_checks + len(self.i))
+
+    def compare(self, positions, radius, i, j, width, height, depth=None):
+        n = len(positions)
+        exact = grid_pairs(positions, radius, width, height, depth=depth)
+        listed = np.concatenate([i * n + j, j * n + i])
+        missing = np.setdiff1d(exact[0] * n + exact[1], listed)
+        if len(missing):
+            a, b = divmod(int(missing[0]), n)
+            raise RuntimeError(f"Verlet list missed {len(missing)} pairs, e.g. boids {a} and {b} "
+                               f"at distance {lengths(positions[[b]] - positions[[a]])[0]:.3g}")
+
+
+# Pairs from every boid to its k nearest neighbors, in the same layout as
+# grid_pairs. Uses a KD-tree when SciPy is installed, which keeps the query
+# cost per boid bounded however tightly the flock packs.
+def knn_pairs(positions, k, width, height, depth=None):
+    n = len(positions)
+    k = min(k, n - 1)
+    if k <= 0:
+        empty = np.zeros(0, dtype=INDEX_DTYPE)
+        return empty, empty, np.zeros((0, positions.shape[1])), np.zeros(0), 0
+    if kdtree_class() is not None:
+        i, j, pair_checks = kdtree_knn(positions, k)
+    else:
+        i, j, pair_checks = grid_knn(positions, k, width, height, depth)
+    offset = positions[j] - positions[i]
+    distance = np.sqrt((offset ** 2).sum(axis=1))
+    return i, j, offset, distance, pair_checks
+
+
+# SciPy's KD-tree, imported on first use since loading it takes longer than
+# importing the rest of the engine; None when SciPy is not installed
+@functools.lru_cache(maxsize=None)
+def kdtree_class():
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:  # k-NN queries fall back to the cell grid
+        return None
+    return cKDTree
+
+
+def kdtree_knn(positions, k):
+    n = len(positions)
+    _, found = kdtree_class()(positions).query(positions, k=k + 1)
+    # Drop each boid itself; with duplicate positions it may not come first
+    other = found != np.arange(n)[:, None]
+    keep = other & (np.cumsum(other, axis=1) <= k)
+    return np.repeat(np.arange(n), k), found[keep], found.size
+
+
+# The cell size is chosen so a cell holds about k boids on average; boids
+# whose k-th candidate could still be beaten by a boid outside the searched
+# block get a wider block on the next pass.
+def grid_knn(positions, k, width, height, depth=None):
+    n = len(positions)
+    size = world_size(width, height, depth)
+    cell_size = max(1.0, (np.prod(size) * k / n) ** (1 / len(size)))
+    grid = CellGrid(positions, cell_size, width, height, depth)
+    max_ring = max(grid.shape)
+    found_i, found_j = [], []
+    pair_checks = 0
+    active = np.arange(n)
+    ring = 1
+    while len(active):
+        i, j = grid.block_pairs(active, ring)
+        pair_checks += len(i)
+        distance = np.sqrt(((positions[j] - positions[i]) ** 2).sum(axis=1))
+        order = np.lexsort((distance, i))
+        i, j, distance = i[order], j[order], distance[order]
+        counts = np.bincount(i, minlength=n)[active]
+        starts = np.cumsum(counts) - counts
+        kth = np.full(len(active), np.inf)
+        enough = counts >= k
+        kth[enough] = distance[starts[enough] + k - 1]
+        done = (kth <= ring * cell_size) | (ring >= max_ring)
+        rank = np.arange(len(i)) - np.repeat(starts, counts)
+        keep = np.repeat(done, counts) & (rank < k)
+        found_i.append(i[keep])
+        found_j.append(j[keep])
+        active = active[~done]
+        ring += 1
+    return np.concatenate(found_i), np.concatenate(found_j), pair_checks
+
+
+# Neighbor count and velocity/position sums over the boids in view, from pairs.
+# Pairs may cover only the boids in rows, numbered in rows order.
+def view_sums(positions, velocities, pairs, view_radius, rows=slice(None)):
+    i, j, offset, distance, pair_checks = pairs
+    n = len(positions[rows])
+    view = distance < view_radius
+    vi, vj = i[view], j[view]
+    return (np.bincount(vi, minlength=n), sum_by(vi, velocities[vj], n),
+            sum_by(vi, positions[vj], n), 0)
+
+
+# Alignment and cohesion from the view sums
+def view_steering(positions, velocities, view):
+    view_counts, velocity_sums, position_sums, _ = view
+    accel = np.zeros_like(velocities)
+    seen = view_counts > 0
+    if seen.any():
+        counts = view_counts[seen][:, None]
+        avg_velocity = velocity_sums[seen] / counts
+        center_of_mass = position_sums[seen] / counts
+        accel[seen] += (avg_velocity - velocities[seen]) * ALIGNMENT_WEIGHT
+        accel[seen] += (center_of_mass - positions[seen]) * COHESION_WEIGHT
+    return accel
+
+
+# Adds separation and crowd avoidance to accel, returns per-boid neighbor
+# counts. With a DensityField the crowd comes from the field and pairs only
+# need to reach SEPARATION_DISTANCE.
+def short_range_steering(positions, pairs, accel, rows=slice(None), field=None):
+    i, j, offset, distance, pair_checks = pairs
+    n = len(positions[rows])
+
+    close = (distance < SEPARATION_DISTANCE) & (distance > 0)
+    separation_counts = np.bincount(i[close], minlength=n)
+    if close.any():
+        away = offset[close] / distance[close][:, None]
+        accel -= sum_by(i[close], away, n) * SEPARATION_WEIGHT
+    return crowd_steering(positions, pairs, accel, rows, field), separation_counts
+
+
+# Crowd counts and position sums of every boid from pairs reaching at least
+# CROWD_RADIUS; stands in for a DensityField when the steering pairs are
+# cut off some other way, such as at the k nearest neighbors.
+class PairCrowd:
+    def __init__(self, positions, pairs):
+        i, j, offset, distance, pair_checks = pairs
+        crowd = distance < CROWD_RADIUS
+        ci = i[crowd]
+        self.counts = np.bincount(ci, minlength=len(positions))
+        self.sums = sum_by(ci, positions[j[crowd]], len(positions))
+
+    def crowd(self, rows=slice(None)):
+        return self.counts[rows], self.sums[rows]
+
+
+# Adds crowd avoidance to accel, returns per-boid crowd counts
+def crowd_steering(positions, pairs, accel, rows=slice(None), field=None):
+    i, j, offset, distance, pair_checks = pairs
+    own = positions[rows]
+    n = len(own)
+
+    if field is not None:
+        crowd_counts, crowd_sums = field.crowd(rows)
+        crowded = crowd_counts > CROWD_THRESHOLD
+        if crowded.any():
+            avg_position = crowd_sums[crowded] / crowd_counts[crowded][:, None]
+            accel[crowded] += (own[crowded] - avg_position) * CROWD_WEIGHT
+        return crowd_counts
+
+    crowd = distance < CROWD_RADIUS
+    ci = i[crowd]
+    crowd_counts = np.bincount(ci, minlength=n)
+    crowded = crowd_counts > CROWD_THRESHOLD
+    if crowded.any():
+        avg_position = sum_by(ci, positions[j[crowd]], n)[crowded] / crowd_counts[crowded][:, None]
+        accel[crowded] += (own[crowded] - avg_position) * CROWD_WEIGHT
+    return crowd_counts
+
+
+# Combined alignment, cohesion, separation and crowd steering for every boid
+def steer(positions, velocities, pairs, view, stats=None, field=None):
+    accel = view_steering(positions, velocities, view)
+    crowd_counts, separation_counts = short_range_steering(positions, pairs, accel, field=field)
+    if stats is not None:
+        stats.record(pairs[4] + view[3], view[0], crowd_counts, separation_counts)
+    return accel, crowd_counts
+
+
+# Grid steering for the boids in rows only, written into accel and
+# crowd_counts; returns the counters for NeighborStats.record. Chunks only
+# read the shared state, so they can run on several threads at once.
+def steer_rows(positions, velocities, grid, radius, view_radius, rows, accel, crowd_counts,
+               field=None):
+    pairs = grid_pairs(positions, radius, None, None, grid=grid, rows=rows)
+    view = view_sums(positions, velocities, pairs, view_radius, rows)
+    chunk_accel = view_steering(positions[rows], velocities[rows], view)
+    chunk_crowd, separation_counts = short_range_steering(positions, pairs, chunk_accel, rows,
+                                                          field)
+    accel[rows] = chunk_accel
+    crowd_counts[rows] = chunk_crowd
+    return pairs[4], view[0], chunk_crowd, separation_counts
+
+
+# Apply steering and weather, renormalize to the snow-limited speed and wrap.
+# wind_vector, snow_intensity and base_speed may also be given per boid.
+def integrate(positions, velocities, accel, wind_vector, snow_intensity, width, height,
+              base_speed=BASE_SPEED, depth=None):
+    velocities += accel
+    velocities += np.asarray(wind_vector, dtype=velocities.dtype) * WIND_WEIGHT
+    if depth is not None:
+        velocities[:, 2] -= SNOW_FALL * np.asarray(snow_intensity)
+    speed = np.maximum(MIN_SPEED, base_speed * (1 - SNOW_SLOWDOWN * np.asarray(snow_intensity)))
+    if speed.ndim:
+        speed = speed[:, None]
+    norm = np.sqrt((velocities ** 2).sum(axis=1, keepdims=True))
+    velocities *= np.where(norm > 0, speed / np.where(norm > 0, norm, 1), 0)
+    positions += velocities
+
+    # Wrap around the edges of the world
+    size = np.array(world_size(width, height, depth), dtype=positions.dtype)
+    positions[:] = np.where(positions < 0, size, np.where(positions > size, 0, positions))
+
+
+# interaction="grid" finds every neighbor through the cell grid;
+# interaction="quadtree" approximates alignment and cohesion from a Barnes-Hut
+# quadtree (accuracy set by theta) and keeps separation and crowding exact;
+# interaction="topological" applies alignment, cohesion and separation to
+# the k nearest neighbors only, with fog reducing k instead of the view
+# radius; crowd avoidance and Density still count every boid within
+# CROWD_RADIUS, however small k gets, from the occupancy grid or, with
+# crowding="pairs", from an exact search.
+# backend="numba" compiles the 2D grid interaction with exact crowding and
+# without obstacles, species or skin; other interactions, crowding="field",
+# obstacles, species, Verlet lists and machines without Numba use the NumPy
+# code (backend tells which one runs), and a 3D world raises ValueError.
+# workers threads (default: one per core) share the NumPy grid steering of
+# large flocks, one chunk of boids each.
+# skin > 0 reuses Verlet neighbor lists of radius reach + skin across steps
+# for the grid and quadtree interactions; check_neighbors compares them with
+# a full grid search every step.
+# dtype=np.float32 halves the memory and bandwidth of the state for very
+# large flocks.
+# crowding="field" takes crowd avoidance and Density from a per-step
+# occupancy grid instead of CROWD_RADIUS pairs (NumPy paths only). The
+# default is "pairs", except for the topological interaction, whose bounded
+# k-nearest search would otherwise gain an unbounded CROWD_RADIUS search.
+# stagger > 1 refreshes the grid steering of only every stagger-th boid per
+# step, in rotation, and reuses the last steering of the others; every boid
+# still moves every step. Only the NumPy grid search without a Verlet list
+# staggers, so other interactions, skin and backend="numba" are rejected.
+# species (a flock_species.SpeciesMix) mixes several kinds of boids, each
+# with its own radii, speed and weather sensitivity, whose responses to each
+# other come from the mix's interaction matrices (grid interaction only).
+# depth makes the world a 3D box of width x height x depth; the quadtree
+# interaction and obstacles are 2D only.
+# trace_allocations records the memory allocated per step and phase (see
+# flock_memory.py) for the metrics rows.
+class Flock:
+    def __init__(self, num_boids=NUM_BOIDS, width=WIDTH, height=HEIGHT, seed=None,
+                 collect_stats=False, view_radius=VIEW_RADIUS, interaction="grid",
+                 theta=DEFAULT_THETA, neighbors=TOPOLOGICAL_NEIGHBORS, backend="numpy",
+                 workers=None, skin=0, stagger=1, dtype=np.float64, crowding=None,
+                 obstacles=None, species=None, depth=None, trace_allocations=False,
+                 check_neighbors=False):
+        if interaction not in INTERACTIONS:
+            raise ValueError(f"unknown interaction {interaction!r}, expected one of {INTERACTIONS}")
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+        if crowding is None:
+            crowding = "field" if interaction == "topological" else "pairs"
+        if crowding not in CROWDINGS:
+            raise ValueError(f"unknown crowding {crowding!r}, expected one of {CROWDINGS}")
+        if species is not None and (interaction != "grid" or stagger > 1):
+            raise ValueError("species need the grid interaction without stagger")
+        if stagger > 1 and (interaction != "grid" or skin > 0 or backend == "numba"):
+            raise ValueError("stagger needs the grid interaction with the numpy backend and no skin")
+        if depth is not None and (interaction == "quadtree" or obstacles is not None):
+            raise ValueError("the quadtree interaction and obstacles are 2D only")
+        if depth is not None and backend == "numba":
+            raise ValueError("the numba backend is 2D only")
+        self.stepper = None
+        # The fused kernel is 2D, counts crowds from exact pairs, searches its
+        # own cell list every step and knows nothing about obstacles or species
+        if (backend == "numba" and interaction == "grid" and crowding == "pairs" and skin == 0
+                and obstacles is None and species is None):
+            import flock_numba
+            if flock_numba.AVAILABLE:
+                self.stepper = flock_numba.NumbaStepper()
+        self.backend = "numba" if self.stepper is not None else "numpy"
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.view_radius = view_radius
+        self.interaction = interaction
+        self.theta = theta
+        self.neighbors = neighbors
+        self.crowding = crowding
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.pool = None
+        self.verlet = VerletList(skin, check_neighbors) if skin > 0 else None
+        self.stagger = max(1, int(stagger))
+        self.phase = 0
+        self.last_steering = None
+        # Cell grid the last step built over the flock (positions before that
+        # step moved them), or None; lets the renderer cull without its own
+        self.grid = None
+        self.obstacles = obstacles  # flock_obstacles.ObstacleField or None
+        self.species = species
+        self.rng = np.random.default_rng(seed)
+        self.positions, self.velocities = self.spawn(num_boids, dtype)
+        # Index in species.species of every boid
+        self.species_of = species.assign(num_boids) if species is not None else None
+        self.crowd_counts = np.zeros(num_boids, dtype=np.int64)
+        self.stats = NeighborStats() if collect_stats else None
+        self.tracer = AllocationTracer() if trace_allocations else None
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def size(self):
+        return world_size(self.width, self.height, self.depth)
+
+    @property
+    def dims(self):
+        return len(self.size)
+
+    # Random positions and headings for count new boids
+    def spawn(self, count, dtype):
+        high = [extent + 1 for extent in self.size]
+        positions = self.rng.integers(0, high, size=(count, self.dims)).astype(dtype)
+        directions = self.rng.uniform(-1, 1, size=(count, self.dims))
+        norm = np.sqrt((directions ** 2).sum(axis=1, keepdims=True))
+        velocities = (directions / np.where(norm > 0, norm, 1) * BASE_SPEED).astype(dtype)
+        if self.obstacles is not None:
+            # Draw boids that landed inside an obstacle again
+            for _ in range(SPAWN_ATTEMPTS):
+                inside = np.flatnonzero(self.obstacles.contains(positions))
+                if len(inside) == 0:
+                    break
+                positions[inside] = self.rng.integers(0, high, size=(len(inside), self.dims))
+        return positions, velocities
+
+    # Drop boids from the end of the flock or add new random ones
+    def resize(self, num_boids):
+        n = len(self)
+        if num_boids == n:
+            return
+        if num_boids < n:
+            self.positions = self.positions[:num_boids].copy()
+            self.velocities = self.velocities[:num_boids].copy()
+            self.crowd_counts = self.crowd_counts[:num_boids].copy()
+            if self.species is not None:
+                self.species_of = self.species_of[:num_boids].copy()
+        elif num_boids > n:
+            positions, velocities = self.spawn(num_boids - n, self.positions.dtype)
+            self.positions = np.concatenate([self.positions, positions])
+            self.velocities = np.concatenate([self.velocities, velocities])
+            self.crowd_counts = np.concatenate([self.crowd_counts,
+                                                np.zeros(num_boids - n, dtype=np.int64)])
+            if self.species is not None:
+                # New boids keep the proportions of the mix
+                self.species_of = np.concatenate([self.species_of,
+                                                  self.species.draw(num_boids - n, self.rng)])
+        if self.verlet is not None:
+            self.verlet.reference = None
+        self.last_steering = None
+        self.grid = None
+
+    # Pairs closer than radius; reach is the largest radius this interaction
+    # asks for (no fog), so fog changes never force a Verlet rebuild
+    def neighbor_pairs(self, radius, reach):
+        if self.verlet is not None:
+            return self.verlet.pairs(self.positions, radius, reach, *self.size)
+        self.grid = CellGrid(self.positions, radius, *self.size)
+        return grid_pairs(self.positions, radius, self.width, self.height, self.grid)
+
+    def chunks(self):
+        count = min(self.workers, len(self) // MIN_CHUNK_SIZE)
+        if count < 2:
+            return None
+        bounds = np.linspace(0, len(self), count + 1).astype(int).tolist()
+        return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    # Grid steering with each chunk of boids handled by a pool thread
+    def threaded_steering(self, chunks, view_radius, radius, field):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="flock")
+        grid = self.grid = CellGrid(self.positions, radius, *self.size)
+        accel = np.empty_like(self.velocities)
+        crowd_counts = np.empty(len(self), dtype=np.int64)
+        futures = [self.pool.submit(steer_rows, self.positions, self.velocities, grid, radius,
+                                    view_radius, rows, accel, crowd_counts, field)
+                   for rows in chunks]
+        for future in futures:
+            counters = future.result()
+            if self.stats is not None:
+                self.stats.record(*counters)
+        self.crowd_counts = crowd_counts
+        return accel
+
+    # Grid steering for one rotating share of the flock, reusing the previous
+    # steering of everyone else
+    def staggered_steering(self, view_radius, radius, field):
+        n = len(self)
+        if self.last_steering is None or len(self.last_steering) != n:
+            self.last_steering = np.zeros_like(self.velocities)
+            rows = slice(None)
+        else:
+            rows = np.arange(self.phase, n, self.stagger)
+            self.phase = (self.phase + 1) % self.stagger
+        crowd_counts = self.crowd_counts if len(self.crowd_counts) == n else np.zeros(n, dtype=np.int64)
+        grid = self.grid = CellGrid(self.positions, radius, *self.size)
+        counters = steer_rows(self.positions, self.velocities, grid, radius, view_radius, rows,
+                              self.last_steering, crowd_counts, field)
+        if self.stats is not None:
+            self.stats.record(*counters)
+        self.crowd_counts = crowd_counts
+        return self.last_steering
+
+    # Steering of a mixed flock: one pair search, out to each species' own
+    # radius, with every pair weighted by the interaction matrices
+    def species_steering(self, fog_density, field):
+        species = self.species
+        view_radii = species.view_radii(fog_density)
+        short_range = species.separation_distance
+        if field is None:
+            short_range = np.maximum(short_range, CROWD_RADIUS)
+        radii = np.maximum(view_radii, short_range)
+        if self.verlet is not None:
+            pairs = self.neighbor_pairs(radii.max(),
+                                        np.maximum(species.view_radius, short_range).max())
+        else:
+            self.grid = CellGrid(self.positions, radii.min(), *self.size)
+            pairs = species.pairs(self.positions, self.species_of, radii, self.grid)
+        accel, self.crowd_counts = species.steer(self.positions, self.velocities, self.species_of,
+                                                 pairs, view_radii, self.stats, field)
+        return accel
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.tracer is not None:
+            self.tracer.close()
+
+    # Context in which the allocations of one phase of a step are traced
+    def traced(self, name):
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.phase(name)
+
+    def steering(self, fog_density):
+        view_radius = adjusted_view_radius(fog_density, self.view_radius)
+        field = None
+        short_range = max(CROWD_RADIUS, SEPARATION_DISTANCE)
+        if self.crowding == "field":
+            field = DensityField(self.positions, CROWD_RADIUS, *self.size)
+            short_range = SEPARATION_DISTANCE
+        if self.species is not None:
+            return self.species_steering(fog_density, field)
+        if self.interaction == "topological":
+            k = adjusted_neighbor_count(fog_density, self.neighbors)
+            pairs = knn_pairs(self.positions, k, *self.size)
+            view = view_sums(self.positions, self.velocities, pairs, np.inf)
+            if field is None:
+                crowd_pairs = self.neighbor_pairs(CROWD_RADIUS, CROWD_RADIUS)
+                field = PairCrowd(self.positions, crowd_pairs)
+                pairs = pairs[:4] + (pairs[4] + crowd_pairs[4],)
+        elif self.interaction == "quadtree":
+            pairs = self.neighbor_pairs(short_range, short_range)
+            tree = QuadTree(self.positions, self.velocities, self.width, self.height)
+            view = tree.view_sums(view_radius, self.theta)
+        elif self.stagger > 1 and self.verlet is None:
+            return self.staggered_steering(view_radius, max(view_radius, short_range), field)
+        else:
+            chunks = self.chunks() if self.verlet is None else None
+            if chunks is not None:
+                return self.threaded_steering(chunks, view_radius, max(view_radius, short_range),
+                                              field)
+            pairs = self.neighbor_pairs(max(view_radius, short_range),
+                                        max(self.view_radius, short_range))
+            view = view_sums(self.positions, self.velocities, pairs, view_radius)
+        accel, self.crowd_counts = steer(self.positions, self.velocities, pairs, view, self.stats,
+                                         field)
+        return accel
+
+    # wind_vector may have a vertical component in 3D
+    def step(self, wind_vector=(0, 0), snow_intensity=0.0, fog_density=0.0):
+        self.grid = None
+        if len(wind_vector) != self.dims:
+            wind_vector = (tuple(wind_vector) + (0.0,) * self.dims)[:self.dims]
+        if self.stats is not None:
+            self.stats.reset()
+        if self.tracer is not None:
+            self.tracer.reset()
+        if self.stepper is not None:
+            view_radius = adjusted_view_radius(fog_density, self.view_radius)
+            search_radius = max(view_radius, CROWD_RADIUS, SEPARATION_DISTANCE)
+            # The fused kernel steers and integrates in one pass
+            with self.traced("Steering"):
+                self.stepper.step(self, view_radius, search_radius, wind_vector, snow_intensity)
+        else:
+            with self.traced("Steering"):
+                accel = self.steering(fog_density)
+            if self.obstacles is not None:
+                with self.traced("Obstacles"):
+                    accel = accel + self.obstacles.steering(self.positions)
+            base_speed = BASE_SPEED
+            if self.species is not None:
+                wind_vector, snow_intensity, base_speed = self.species.weather(
+                    self.species_of, wind_vector, snow_intensity)
+            with self.traced("Integrate"):
+                integrate(self.positions, self.velocities, accel, wind_vector, snow_intensity,
+                          self.width, self.height, base_speed, self.depth)
+            if self.obstacles is not None:
+                with self.traced("Obstacles"):
+                    self.obstacles.resolve(self.positions)
+        if self.tracer is not None:
+            self.tracer.finish()
@@ -0,0 +1,207 @@
+# Replicate flocks stepped together as one batch.
+#
+# R independent flocks of N boids live in arrays of shape (R, N, 2). For the
+# neighbor search each replicate is shifted into its own strip of a wider
+# world, with a gap larger than any interaction radius, so one grid pass
+# serves all of them and no boid ever sees another replicate. Every replicate
+# can have its own weather.
+#
+# Example:
+#   python flock_ensemble.py --replicates 32 --steps 900 --snow 0 1 2 3 --output ensemble.csv
+#   python flock_ensemble.py --replicates 4 --steps 100 --crowding field --check
+
+import argparse
+import time
+
+import numpy as np
+
+from flock_density import DensityField, field_cell_size
+from flock_engine import (CROWD_RADIUS, CROWDINGS, HEIGHT, NUM_BOIDS, SEPARATION_DISTANCE,
+                          VIEW_RADIUS, WIDTH, CellGrid, Flock, adjusted_view_radius, integrate,
+                          steer, view_sums)
+from flock_metrics import METRICS_HEADER, BufferedMetricsWriter
+from flock_sim import Weather, level
+
+ENSEMBLE_HEADER = METRICS_HEADER + ["Replicate"]
+METRIC_NAMES = METRICS_HEADER[2:]
+CHECK_TOLERANCE = 1e-6  # Largest position difference --check accepts from a standalone Flock
+
+
+# Pairs of the replicates closer than radius, in the layout of grid_pairs.
+# The shifted positions only place the boids in the cell grid of the whole
+# ensemble (world_width wide); offsets and distances come from each
+# replicate's own coordinates, which keep the precision of a standalone
+# Flock however far along the replicate sits. Every boid's pairs are then
+# put in the order grid_pairs gives them in a replicate-sized world of cells
+# of its replicate's own radius (radii, one per boid), by the cell offset of
+# the neighbor and then by neighbor, so that sums over them round the same
+# way as in a standalone Flock.
+def replicate_pairs(positions, shifted, radii, width, height, world_width):
+    radius = radii.max()
+    i, j = CellGrid(shifted, radius, world_width, height).candidate_pairs()
+    offset = positions[j] - positions[i]
+    distance = np.sqrt((offset ** 2).sum(axis=1))
+    keep = distance < radius
+    pair_checks = len(keep)
+    i, j, offset, distance = i[keep], j[keep], offset[keep], distance[keep]
+    cx, cy = [np.clip(positions[:, axis] // radii, 0, np.maximum(1, np.ceil(extent / radii)) - 1)
+              for axis, extent in enumerate((width, height))]
+    order = np.lexsort((j, (cx[j] - cx[i] + 1) * 3 + cy[j] - cy[i] + 1))
+    return i[order], j[order], offset[order], distance[order], pair_checks
+
+
+class Ensemble:
+    def __init__(self, replicates, num_boids=NUM_BOIDS, width=WIDTH, height=HEIGHT, seed=None,
+                 view_radius=VIEW_RADIUS, dtype=np.float64, crowding="pairs"):
+        if crowding not in CROWDINGS:
+            raise ValueError(f"unknown crowding {crowding!r}, expected one of {CROWDINGS}")
+        self.width = width
+        self.height = height
+        self.view_radius = view_radius
+        self.crowding = crowding
+        # Replicate r starts exactly like Flock(seed=seeds[r])
+        self.seeds = np.random.SeedSequence(seed).spawn(replicates)
+        flocks = [Flock(num_boids, width, height, seed=child, dtype=dtype) for child in self.seeds]
+        self.positions = np.stack([flock.positions for flock in flocks])
+        self.velocities = np.stack([flock.velocities for flock in flocks])
+        self.crowd_counts = np.zeros((replicates, num_boids), dtype=np.int64)
+        self.replicate = np.repeat(np.arange(replicates), num_boids)
+        self.gap = 2 * max(view_radius, CROWD_RADIUS, SEPARATION_DISTANCE)
+        # Replicates start on a density field cell boundary, so each is binned
+        # into the same cells as a Flock of its own, counted in whole cells
+        # since a boid on a cell edge may round either way once shifted
+        cell = field_cell_size(CROWD_RADIUS)
+        field_columns = int(np.ceil((width + self.gap) / cell))
+        self.gap = field_columns * cell - width
+        self.cell_offset = np.stack([self.replicate * field_columns,
+                                     np.zeros(len(self.replicate), dtype=np.int64)], axis=1)
+        # Places the replicates side by side in the pair grid; kept in float64
+        # so rounding cannot move a float32 boid away from its neighbors
+        self.shift = np.stack([self.replicate * (width + self.gap),
+                               np.zeros(len(self.replicate))], axis=1)
+
+    @property
+    def replicates(self):
+        return self.positions.shape[0]
+
+    # weathers is one Weather for every replicate or a list with one each
+    def step(self, weathers):
+        if isinstance(weathers, Weather):
+            weathers = [weathers] * self.replicates
+        wind = np.array([weather.wind_vector() for weather in weathers])
+        snow = np.array([weather.snow_intensity() for weather in weathers])
+        view_radius = np.array([adjusted_view_radius(weather.fog_density(), self.view_radius)
+                                for weather in weathers])
+
+        positions = self.positions.reshape(-1, 2)
+        velocities = self.velocities.reshape(-1, 2)
+        shifted = positions + self.shift
+        world_width = self.replicates * (self.width + self.gap)
+        field = None
+        short_range = max(CROWD_RADIUS, SEPARATION_DISTANCE)
+        if self.crowding == "field":
+            # The gap keeps every crowd box within one replicate
+            field = DensityField(positions, CROWD_RADIUS, world_width, self.height,
+                                 cell_offset=self.cell_offset)
+            short_range = SEPARATION_DISTANCE
+        radii = np.maximum(view_radius, short_range)[self.replicate]
+        pairs = replicate_pairs(positions, shifted, radii, self.width, self.height, world_width)
+        view = view_sums(positions, velocities, pairs, view_radius[self.replicate[pairs[0]]])
+        accel, crowd_counts = steer(positions, velocities, pairs, view, field=field)
+        integrate(positions, velocities, accel, wind[self.replicate], snow[self.replicate],
+                  self.width, self.height)
+        self.crowd_counts = crowd_counts.reshape(self.replicates, -1)
+
+    # Standalone Flocks that should follow the replicates step for step
+    def standalone_flocks(self):
+        return [Flock(self.positions.shape[1], self.width, self.height, seed=child,
+                      view_radius=self.view_radius, dtype=self.positions.dtype,
+                      crowding=self.crowding)
+                for child in self.seeds]
+
+    # Avg Speed, Avg Alignment, Density and Cohesion of every replicate, shape (R, 4)
+    def metrics(self):
+        speed = np.sqrt((self.velocities ** 2).sum(axis=2)).mean(axis=1)
+        alignment = np.degrees(np.arctan2(self.velocities[..., 1], self.velocities[..., 0])).mean(axis=1)
+        density = self.crowd_counts.mean(axis=1)
+        center_of_mass = self.positions.mean(axis=1, keepdims=True)
+        cohesion = np.sqrt(((self.positions - center_of_mass) ** 2).sum(axis=2)).mean(axis=1)
+        return np.stack([speed, alignment, density, cohesion], axis=1)
+
+
+def format_summary(configs, means):
+    lines = ["Replicate,Weather_Config," + ",".join(METRIC_NAMES)]
+    for r, (config, row) in enumerate(zip(configs, means)):
+        lines.append(f'{r},"{config}",' + ",".join(f"{value:.6g}" for value in row))
+    for config in dict.fromkeys(configs):
+        group = means[[c == config for c in configs]]
+        cells = [f"{m:.6g} +- {s:.3g}" for m, s in zip(group.mean(axis=0), group.std(axis=0))]
+        lines.append(f'all ({len(group)}),"{config}",' + ",".join(cells))
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run replicate flocks as one batch.")
+    parser.add_argument("--replicates", type=int, default=16, help="number of replicate flocks")
+    parser.add_argument("--boids", type=int, default=NUM_BOIDS, help="boids per replicate")
+    parser.add_argument("--steps", type=int, default=900, help="number of steps to run")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the whole ensemble")
+    for name in ("wind", "snow", "fog"):
+        parser.add_argument(f"--{name}", type=level, nargs="+", default=[0],
+                            help=f"{name} level, one for all replicates or one per replicate")
+    parser.add_argument("--no-weather", action="store_true", help="disable weather effects")
+    parser.add_argument("--view-radius", type=float, default=VIEW_RADIUS,
+                        help="view radius for alignment and cohesion before fog")
+    parser.add_argument("--crowding", choices=CROWDINGS, default="pairs",
+                        help="crowd avoidance and Density from exact pairs or the occupancy grid")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="floating point type of positions and velocities")
+    parser.add_argument("--output", default=None, help="CSV file for per-step, per-replicate metrics")
+    parser.add_argument("--check", action="store_true",
+                        help="also step every replicate as a standalone Flock and fail if they differ")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    levels = {}
+    for name in ("wind", "snow", "fog"):
+        values = getattr(args, name)
+        if len(values) not in (1, args.replicates):
+            parser.error(f"--{name} needs 1 or {args.replicates} levels, got {len(values)}")
+        levels[name] = values * args.replicates if len(values) == 1 else values
+    weathers = [Weather(wind, snow, fog, enabled=not args.no_weather)
+                for wind, snow, fog in zip(levels["wind"], levels["snow"], levels["fog"])]
+    configs = [weather.config() for weather in weathers]
+
+    ensemble = Ensemble(args.replicates, args.boids, seed=args.seed, view_radius=args.view_radius,
+                        dtype=args.dtype, crowding=args.crowding)
+    writer = BufferedMetricsWriter(args.output, ENSEMBLE_HEADER) if args.output else None
+    totals = np.zeros((args.replicates, len(METRIC_NAMES)))
+    flocks = ensemble.standalone_flocks() if args.check else []
+    deviation = 0.0
+    try:
+        for _ in range(args.steps):
+            ensemble.step(weathers)
+            for flock, weather, positions in zip(flocks, weathers, ensemble.positions):
+                flock.step(weather.wind_vector(), weather.snow_intensity(), weather.fog_density())
+                deviation = max(deviation, float(np.abs(flock.positions - positions).max()))
+            metrics = ensemble.metrics()
+            totals += metrics
+            if writer is not None:
+                now = time.time()
+                for r, row in enumerate(metrics.tolist()):
+                    writer.write([now, configs[r]] + row + [r])
+    finally:
+        if writer is not None:
+            writer.close()
+    print(format_summary(configs, totals / max(args.steps, 1)))
+    if args.check:
+        print(f"Largest position difference from standalone flocks: {deviation:.3g}")
+        if deviation > CHECK_TOLERANCE:
+            raise SystemExit("replicates diverged from standalone flocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Memory allocation tracing for flock steps.
+#
+# A Flock built with trace_allocations=True records for every step how far
+# traced memory rose above where the step started (Alloc Peak: pair arrays
+# and other temporaries), what the step kept (Alloc Net), the memory traced
+# in all after it and the number of garbage collections that ran during it,
+# plus the rise within each phase of the step. The columns follow the
+# neighbor statistics in the metrics rows.
+#
+# Tracing goes through tracemalloc, which sees NumPy's array buffers as well
+# as Python objects but slows every allocation down, so it is meant for
+# measurement runs rather than for timing them.
+
+import gc
+import tracemalloc
+from contextlib import contextmanager
+
+PHASES = ("Steering", "Obstacles", "Integrate")
+
+
+class AllocationTracer:
+    HEADER = (["Alloc Peak", "Alloc Net", "Traced Memory", "GC Collections"]
+              + [f"{phase} Alloc Peak" for phase in PHASES])
+
+    def __init__(self):
+        # Leave tracemalloc running if someone else started it
+        self.owns_tracing = not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+        self.collections = 0
+        gc.callbacks.append(self.count_collection)
+        self.reset()
+        self.row = [0] * len(self.HEADER)
+
+    def count_collection(self, phase, info):
+        if phase == "start":
+            self.collections += 1
+
+    # Called at the start of a step
+    def reset(self):
+        self.phases = dict.fromkeys(PHASES, 0)
+        self.collections = 0
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.peak = self.base
+
+    @contextmanager
+    def phase(self, name):
+        start, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak = max(self.peak, peak)
+            self.phases[name] += peak - start
+
+    # Called at the end of a step, before anything else allocates
+    def finish(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        self.row = ([self.peak - self.base, current - self.base, current, self.collections]
+                    + [self.phases[phase] for phase in PHASES])
+
+    def as_row(self):
+        return list(self.row)
+
+    def close(self):
+        if self.count_collection in gc.callbacks:
+            gc.callbacks.remove(self.count_collection)
+        if self.owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.owns_tracing = False
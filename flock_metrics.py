@@ -0,0 +1,100 @@
+# Flocking metrics in the same layout as flocking_weather_data.csv.
+
+import csv
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from flock_engine import NeighborStats
+from flock_memory import AllocationTracer
+
+METRICS_HEADER = ["Time", "Weather_Config", "Avg Speed", "Avg Alignment", "Density", "Cohesion"]
+STEP_TIME = "Step Time"  # Seconds spent in Flock.step
+FLUSH_INTERVAL = 1.0  # Seconds between background flushes
+FLUSH_ROWS = 1024     # Rows that trigger an early flush
+
+
+def metrics_header(flock):
+    header = METRICS_HEADER + [STEP_TIME]
+    if flock.stats is not None:
+        header += NeighborStats.HEADER
+    if flock.tracer is not None:
+        header += AllocationTracer.HEADER
+    return header
+
+
+# Avg Speed, Avg Alignment (mean heading in degrees), Density (mean number of
+# boids within CROWD_RADIUS, from the same crowd counts the flock steered
+# with) and Cohesion (mean distance to the center of mass)
+def compute_metrics(flock):
+    positions, velocities = flock.positions, flock.velocities
+    avg_speed = float(np.sqrt((velocities ** 2).sum(axis=1)).mean())
+    avg_alignment = float(np.degrees(np.arctan2(velocities[:, 1], velocities[:, 0])).mean())
+    density = float(flock.crowd_counts.mean())
+    center_of_mass = positions.mean(axis=0)
+    cohesion = float(np.sqrt(((positions - center_of_mass) ** 2).sum(axis=1)).mean())
+    return [avg_speed, avg_alignment, density, cohesion]
+
+
+def metrics_row(flock, weather_config, step_time, now=None):
+    row = [time.time() if now is None else now, weather_config] + compute_metrics(flock)
+    row.append(step_time)
+    if flock.stats is not None:
+        row += flock.stats.as_row()
+    if flock.tracer is not None:
+        row += flock.tracer.as_row()
+    return row
+
+
+# Writes metrics rows to a CSV file from a background thread. write() only
+# appends to a deque; the thread writes and flushes whatever has queued up
+# every flush_interval seconds, or sooner once flush_rows rows are waiting,
+# so a slow disk never holds up a simulation step. close() writes the rest.
+class BufferedMetricsWriter:
+    def __init__(self, path, header=METRICS_HEADER, flush_interval=FLUSH_INTERVAL,
+                 flush_rows=FLUSH_ROWS):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.rows = deque()
+        self.wakeup = threading.Event()
+        self.closing = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_rows:
+            self.wakeup.set()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.closing = True
+            self.wakeup.set()
+            self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while not self.closing:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        if self.error is not None:
+            return
+        rows = self.rows
+        try:
+            while rows:
+                self.writer.writerow(rows.popleft())
+            self.file.flush()
+        except OSError as error:
+            self.error = error
@@ -0,0 +1,175 @@
+# Numba-compiled steering and integration for the grid interaction.
+#
+# One fused kernel walks the cell list for each boid, accumulates all four
+# rules in scalars, applies wind and snow, renormalizes, moves and wraps the
+# boid, without building any pair arrays. Boids are processed in parallel and
+# read the previous state while writing into a second buffer, so results match
+# the NumPy engine. When Numba is not installed AVAILABLE is False and the
+# engine keeps using NumPy.
+
+import math
+
+import numpy as np
+
+from flock_engine import (ALIGNMENT_WEIGHT, BASE_SPEED, COHESION_WEIGHT, CROWD_RADIUS,
+                          CROWD_THRESHOLD, CROWD_WEIGHT, INDEX_DTYPE, MIN_SPEED,
+                          SEPARATION_DISTANCE, SEPARATION_WEIGHT, SNOW_SLOWDOWN, WIND_WEIGHT)
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+AVAILABLE = njit is not None
+
+
+# Counting sort of the boids into cells
+def _build_cells(positions, cell_size, cols, rows, cell_of, counts, starts, fill, order):
+    counts[:] = 0
+    for b in range(positions.shape[0]):
+        cx = min(max(int(positions[b, 0] // cell_size), 0), cols - 1)
+        cy = min(max(int(positions[b, 1] // cell_size), 0), rows - 1)
+        cell_of[b] = cy * cols + cx
+        counts[cy * cols + cx] += 1
+    running = 0
+    for c in range(cols * rows):
+        starts[c] = running
+        fill[c] = running
+        running += counts[c]
+    for b in range(positions.shape[0]):
+        order[fill[cell_of[b]]] = b
+        fill[cell_of[b]] += 1
+
+
+def _step(positions, velocities, new_positions, new_velocities, cell_of, counts, starts, order,
+          cols, rows, view_radius, wind_x, wind_y, speed, width, height,
+          view_counts, crowd_counts, separation_counts, pair_checks):
+    for b in prange(positions.shape[0]):
+        px, py = positions[b, 0], positions[b, 1]
+        vx, vy = velocities[b, 0], velocities[b, 1]
+        cx, cy = cell_of[b] % cols, cell_of[b] // cols
+        view_n = 0
+        crowd_n = 0
+        separation_n = 0
+        tested = 0
+        avg_vx = avg_vy = center_x = center_y = 0.0
+        away_x = away_y = crowd_x = crowd_y = 0.0
+        for ny in range(max(cy - 1, 0), min(cy + 2, rows)):
+            for nx in range(max(cx - 1, 0), min(cx + 2, cols)):
+                cell = ny * cols + nx
+                for s in range(starts[cell], starts[cell] + counts[cell]):
+                    other = order[s]
+                    if other == b:
+                        continue
+                    tested += 1
+                    dx = positions[other, 0] - px
+                    dy = positions[other, 1] - py
+                    distance = math.sqrt(dx * dx + dy * dy)
+                    if distance < view_radius:
+                        view_n += 1
+                        avg_vx += velocities[other, 0]
+                        avg_vy += velocities[other, 1]
+                        center_x += positions[other, 0]
+                        center_y += positions[other, 1]
+                    if 0 < distance < SEPARATION_DISTANCE:
+                        separation_n += 1
+                        away_x -= dx / distance
+                        away_y -= dy / distance
+                    if distance < CROWD_RADIUS:
+                        crowd_n += 1
+                        crowd_x += positions[other, 0]
+                        crowd_y += positions[other, 1]
+
+        ax = away_x * SEPARATION_WEIGHT
+        ay = away_y * SEPARATION_WEIGHT
+        if view_n > 0:
+            ax += (avg_vx / view_n - vx) * ALIGNMENT_WEIGHT + (center_x / view_n - px) * COHESION_WEIGHT
+            ay += (avg_vy / view_n - vy) * ALIGNMENT_WEIGHT + (center_y / view_n - py) * COHESION_WEIGHT
+        if crowd_n > CROWD_THRESHOLD:
+            ax += (px - crowd_x / crowd_n) * CROWD_WEIGHT
+            ay += (py - crowd_y / crowd_n) * CROWD_WEIGHT
+
+        vx += ax + wind_x * WIND_WEIGHT
+        vy += ay + wind_y * WIND_WEIGHT
+        norm = math.sqrt(vx * vx + vy * vy)
+        if norm > 0:
+            vx *= speed / norm
+            vy *= speed / norm
+        else:
+            vx = vy = 0.0
+        px += vx
+        py += vy
+
+        # Wrap around screen edges
+        if px < 0:
+            px = width
+        elif px > width:
+            px = 0.0
+        if py < 0:
+            py = height
+        elif py > height:
+            py = 0.0
+
+        new_positions[b, 0], new_positions[b, 1] = px, py
+        new_velocities[b, 0], new_velocities[b, 1] = vx, vy
+        view_counts[b] = view_n
+        crowd_counts[b] = crowd_n
+        separation_counts[b] = separation_n
+        pair_checks[b] = tested
+
+
+if AVAILABLE:
+    _build_cells = njit(cache=True)(_build_cells)
+    _step = njit(parallel=True, cache=True)(_step)
+
+
+# Owns the preallocated cell list, second state buffer and per-boid counters.
+# The per-boid buffers follow the flock size and the per-cell ones only
+# grow, so once fog has settled a step allocates no arrays. It is not free of
+# allocations: calling the two kernels still boxes their arguments, about
+# 1.5 KB of short-lived Python objects per step, all released before the
+# step returns.
+class NumbaStepper:
+    def __init__(self):
+        self.n = -1
+        self.cells = -1
+
+    def _allocate(self, positions, cols, rows):
+        n = len(positions)
+        if n != self.n:
+            self.n = n
+            self.new_positions = np.empty_like(positions)
+            self.new_velocities = np.empty_like(positions)
+            self.cell_of = np.empty(n, dtype=INDEX_DTYPE)
+            self.order = np.empty(n, dtype=INDEX_DTYPE)
+            self.view_counts = np.empty(n, dtype=INDEX_DTYPE)
+            self.crowd_counts = np.empty(n, dtype=INDEX_DTYPE)
+            self.separation_counts = np.empty(n, dtype=INDEX_DTYPE)
+            self.pair_checks = np.empty(n, dtype=INDEX_DTYPE)
+        if cols * rows > self.cells:
+            self.cells = cols * rows
+            self.counts = np.empty(self.cells, dtype=INDEX_DTYPE)
+            self.starts = np.empty(self.cells, dtype=INDEX_DTYPE)
+            self.fill = np.empty(self.cells, dtype=INDEX_DTYPE)
+
+    def step(self, flock, view_radius, search_radius, wind_vector, snow_intensity):
+        cols = max(1, int(math.ceil(flock.width / search_radius)))
+        rows = max(1, int(math.ceil(flock.height / search_radius)))
+        self._allocate(flock.positions, cols, rows)
+        _build_cells(flock.positions, float(search_radius), cols, rows, self.cell_of,
+                     self.counts, self.starts, self.fill, self.order)
+        speed = max(MIN_SPEED, BASE_SPEED * (1 - SNOW_SLOWDOWN * snow_intensity))
+        _step(flock.positions, flock.velocities, self.new_positions, self.new_velocities,
+              self.cell_of, self.counts, self.starts, self.order, cols, rows,
+              float(view_radius), float(wind_vector[0]), float(wind_vector[1]), float(speed),
+              float(flock.width), float(flock.height), self.view_counts, self.crowd_counts,
+              self.separation_counts, self.pair_checks)
+
+        # Swap buffers so the next step writes into the old state
+        flock.positions, self.new_positions = self.new_positions, flock.positions
+        flock.velocities, self.new_velocities = self.new_velocities, flock.velocities
+        flock.crowd_counts = self.crowd_counts
+        if flock.stats is not None:
+            flock.stats.record(self.pair_checks.sum(dtype=np.int64), self.view_counts,
+                               self.crowd_counts, self.separation_counts)
@@ -0,0 +1,118 @@
+# Barnes-Hut style quadtree for the long-range flocking rules.
+#
+# Every node stores the number of boids below it and the sums of their
+# positions and velocities. A view query walks the tree for all boids at once:
+# nodes entirely inside the view circle are taken whole, nodes entirely outside
+# are skipped, and a distant node whose side / distance-to-center-of-mass ratio
+# is below theta is taken whole when its center of mass is in view. Only the
+# remaining nodes are opened, down to individual boids in the leaves. theta = 0
+# gives the exact result; larger values trade accuracy for speed.
+
+import numpy as np
+
+DEFAULT_THETA = 0.5
+LEAF_SIZE = 8  # Target number of boids per leaf
+MAX_DEPTH = 10
+
+
+def _sums(index, values, n):
+    return np.stack([np.bincount(index, weights=values[:, k], minlength=n)
+                     for k in range(values.shape[1])], axis=1)
+
+
+class QuadTree:
+    def __init__(self, positions, velocities, width, height, leaf_size=LEAF_SIZE):
+        n = len(positions)
+        self.size = float(max(width, height))
+        self.depth = 0
+        while self.depth < MAX_DEPTH and n > leaf_size * 4 ** self.depth:
+            self.depth += 1
+
+        # Leaf cell of every boid; coarser levels drop the low bits
+        cells = 1 << self.depth
+        leaf = np.clip((positions // (self.size / cells)).astype(np.int64), 0, cells - 1)
+        self.counts, self.position_sums, self.velocity_sums = [], [], []
+        for d in range(self.depth + 1):
+            coords = leaf >> (self.depth - d)
+            ids = coords[:, 1] * (1 << d) + coords[:, 0]
+            nodes = 4 ** d
+            self.counts.append(np.bincount(ids, minlength=nodes))
+            self.position_sums.append(_sums(ids, positions, nodes))
+            self.velocity_sums.append(_sums(ids, velocities, nodes))
+
+        leaf_ids = leaf[:, 1] * cells + leaf[:, 0]
+        self.order = np.argsort(leaf_ids, kind="stable")
+        self.leaf_starts = np.cumsum(self.counts[-1]) - self.counts[-1]
+        self.positions = positions
+        self.velocities = velocities
+
+    # Per-boid view count, velocity sum, position sum and interactions tested,
+    # excluding the boid itself, for the given view radius
+    def view_sums(self, radius, theta=DEFAULT_THETA):
+        positions, velocities = self.positions, self.velocities
+        n = len(positions)
+        counts = np.zeros(n, dtype=np.int64)
+        velocity_sums = np.zeros_like(velocities)
+        position_sums = np.zeros_like(positions)
+        checks = 0
+        if n == 0:
+            return counts, velocity_sums, position_sums, checks
+
+        boid = np.arange(n)
+        node = np.zeros(n, dtype=np.int64)
+        for d in range(self.depth + 1):
+            checks += len(boid)
+            side = self.size / (1 << d)
+            p = positions[boid]
+            low = np.stack([node % (1 << d), node // (1 << d)], axis=1) * side
+            high = low + side
+            nearest = np.sqrt(((p - np.clip(p, low, high)) ** 2).sum(axis=1))
+            farthest = np.sqrt((np.maximum(np.abs(p - low), np.abs(p - high)) ** 2).sum(axis=1))
+            node_counts = self.counts[d][node]
+            center = self.position_sums[d][node] / node_counts[:, None]
+            to_center = np.sqrt(((center - p) ** 2).sum(axis=1))
+
+            inside = farthest < radius
+            partial = ~inside & (nearest < radius)
+            # Never approximate the node holding the boid, so it is counted exactly once
+            approx = partial & (nearest > 0) & (side < theta * to_center)
+            take = inside | (approx & (to_center < radius))
+            counts += np.bincount(boid[take], weights=node_counts[take], minlength=n).astype(np.int64)
+            velocity_sums += _sums(boid[take], self.velocity_sums[d][node[take]], n)
+            position_sums += _sums(boid[take], self.position_sums[d][node[take]], n)
+
+            opened = partial & ~approx
+            boid, node = boid[opened], node[opened]
+            if d == self.depth:
+                break
+            # Replace every opened node by its non-empty children
+            cx, cy = node % (1 << d), node // (1 << d)
+            child_boid, child_node = [], []
+            for a in (0, 1):
+                for b in (0, 1):
+                    child = (2 * cy + b) * (1 << (d + 1)) + 2 * cx + a
+                    keep = self.counts[d + 1][child] > 0
+                    child_boid.append(boid[keep])
+                    child_node.append(child[keep])
+            boid = np.concatenate(child_boid)
+            node = np.concatenate(child_node)
+
+        # Test the boids of the leaves that are still open one by one
+        leaf_counts = self.counts[-1][node]
+        total = int(leaf_counts.sum())
+        if total:
+            offsets = np.arange(total) - np.repeat(np.cumsum(leaf_counts) - leaf_counts, leaf_counts)
+            i = np.repeat(boid, leaf_counts)
+            j = self.order[np.repeat(self.leaf_starts[node], leaf_counts) + offsets]
+            checks += total
+            seen = np.sqrt(((positions[j] - positions[i]) ** 2).sum(axis=1)) < radius
+            i, j = i[seen], j[seen]
+            counts += np.bincount(i, minlength=n)
+            velocity_sums += _sums(i, velocities[j], n)
+            position_sums += _sums(i, positions[j], n)
+
+        # Every boid has counted itself exactly once
+        counts -= 1
+        velocity_sums -= velocities
+        position_sums -= positions
+        return counts, velocity_sums, position_sums, checks
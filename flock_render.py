@@ -0,0 +1,215 @@
+# Offscreen pygame rendering of a Flock, drawn like the pygame scripts: boids
+# as circles on black, tinted by snow and fog, with the weather status line.
+# Needs no window, so headless runs can render too.
+#
+# A Camera shows part of a world larger than the screen. Only boids in grid
+# cells that overlap the view are looked at, and once boids would shrink
+# below a pixel the view switches to density shading.
+#
+# 3D flocks are seen from above, higher boids brighter and drawn over lower
+# ones.
+
+import numpy as np
+import pygame
+
+from flock_engine import BASE_SPEED, LEVEL_NAMES, CellGrid
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+BOID_COLOR = (0, 200, 255)
+SNOW_COLOR = (200, 200, 255)
+FOG_COLOR = (255, 255, 255)
+OBSTACLE_COLOR = (90, 90, 90)
+BOID_RADIUS = 5
+FPS = 30  # Frame rate of the pygame scripts
+MAX_ZOOM = 8.0
+CULL_CELLS = 8  # Cells across the larger side of the view when culling needs its own grid
+DENSITY_RADIUS = 1.0  # Boid radius in pixels below which density is shaded instead
+DENSITY_BLOCK = 4  # Screen pixels per density cell
+ALTITUDE_SHADES = 4  # Brightness steps from the bottom to the top of a 3D world
+ALTITUDE_DIM = 0.4   # Brightness of boids at the bottom
+
+
+def boid_color(weather):
+    snow = weather.enabled and weather.snow_level > 0
+    fog = weather.enabled and weather.fog_level > 0
+    if snow and fog:
+        # Blend SNOW_COLOR and FOG_COLOR
+        return tuple((s + f) // 2 for s, f in zip(SNOW_COLOR, FOG_COLOR))
+    if snow:
+        return SNOW_COLOR
+    if fog:
+        return FOG_COLOR
+    return BOID_COLOR
+
+
+# color dimmed for boids in altitude band (0 is the bottom)
+def altitude_color(color, band):
+    scale = ALTITUDE_DIM + (1 - ALTITUDE_DIM) * band / (ALTITUDE_SHADES - 1)
+    return tuple(int(c * scale) for c in color)
+
+
+def status_text(weather):
+    def name(level):
+        return LEVEL_NAMES[level] if weather.enabled else "None"
+    return (f"Weather: {'On' if weather.enabled else 'Off'}, Wind: {name(weather.wind_level)}, "
+            f"Snow: {name(weather.snow_level)}, Fog: {name(weather.fog_level)}")
+
+
+# Pan/zoom view of a world that can be larger than the screen. zoom is
+# screen pixels per world unit and (x, y) the world point at the center of
+# the screen; the view never leaves the world unless the whole world fits.
+# Without a zoom the camera shows the whole world.
+class Camera:
+    def __init__(self, world_width, world_height, screen_width, screen_height, zoom=None):
+        self.world_width, self.world_height = world_width, world_height
+        self.screen_width, self.screen_height = screen_width, screen_height
+        self.x, self.y = world_width / 2, world_height / 2
+        self.zoom = zoom if zoom is not None else self.fit_zoom()
+        self.clamp()
+
+    # Zoom at which the whole world fits on the screen
+    def fit_zoom(self):
+        return min(self.screen_width / self.world_width, self.screen_height / self.world_height)
+
+    def clamp(self):
+        self.zoom = min(max(self.zoom, min(self.fit_zoom(), 1.0)), MAX_ZOOM)
+        half_width = self.screen_width / (2 * self.zoom)
+        half_height = self.screen_height / (2 * self.zoom)
+        if 2 * half_width >= self.world_width:
+            self.x = self.world_width / 2
+        else:
+            self.x = min(max(self.x, half_width), self.world_width - half_width)
+        if 2 * half_height >= self.world_height:
+            self.y = self.world_height / 2
+        else:
+            self.y = min(max(self.y, half_height), self.world_height - half_height)
+
+    # Visible world rectangle as (x0, y0, x1, y1)
+    def viewport(self):
+        half_width = self.screen_width / (2 * self.zoom)
+        half_height = self.screen_height / (2 * self.zoom)
+        return self.x - half_width, self.y - half_height, self.x + half_width, self.y + half_height
+
+    def to_screen(self, points):
+        x0, y0, _, _ = self.viewport()
+        return (points - np.array([x0, y0])) * self.zoom
+
+    # Moves the view by a drag of (dx, dy) screen pixels
+    def pan(self, dx, dy):
+        self.x -= dx / self.zoom
+        self.y -= dy / self.zoom
+        self.clamp()
+
+    # Zooms by factor, keeping the world point under screen_pos in place
+    def zoom_at(self, factor, screen_pos):
+        x0, y0, _, _ = self.viewport()
+        world_x = x0 + screen_pos[0] / self.zoom
+        world_y = y0 + screen_pos[1] / self.zoom
+        self.zoom *= factor
+        self.x = world_x - (screen_pos[0] - self.screen_width / 2) / self.zoom
+        self.y = world_y - (screen_pos[1] - self.screen_height / 2) / self.zoom
+        self.clamp()
+
+
+class Renderer:
+    # Draws onto surface (e.g. the window) or an offscreen surface of the
+    # given size
+    def __init__(self, width, height, surface=None):
+        pygame.font.init()
+        self.surface = surface if surface is not None else pygame.Surface((width, height))
+        self.font = pygame.font.Font(None, 36)
+        self.sprites = {}
+
+    # One pre-drawn circle per color and size, so a frame is a single blits call
+    def sprite(self, color, radius=BOID_RADIUS):
+        if (color, radius) not in self.sprites:
+            sprite = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+            sprite.set_colorkey(BLACK)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            self.sprites[color, radius] = sprite
+        return self.sprites[color, radius]
+
+    # Indices of the boids in view. The candidates come from the cell grid
+    # the flock's last step built, padded by one step of movement and
+    # repeated across the edges for boids that wrapped since; without one a
+    # coarse grid is built here.
+    def visible(self, flock, camera):
+        x0, y0, x1, y1 = camera.viewport()
+        if x0 <= 0 and y0 <= 0 and x1 >= flock.width and y1 >= flock.height:
+            return slice(None)
+        grid = flock.grid
+        pad = BOID_RADIUS
+        if grid is None:
+            grid = CellGrid(flock.positions, max(x1 - x0, y1 - y0) / CULL_CELLS, flock.width, flock.height)
+        else:
+            pad += BASE_SPEED
+        candidates = [grid.boids_in(x0 - pad + sx, y0 - pad + sy, x1 + pad + sx, y1 + pad + sy)
+                      for sx in (-flock.width, 0, flock.width)
+                      for sy in (-flock.height, 0, flock.height)]
+        boids = np.unique(np.concatenate(candidates))
+        points = flock.positions[boids]
+        inside = ((points[:, 0] >= x0 - BOID_RADIUS) & (points[:, 0] <= x1 + BOID_RADIUS)
+                  & (points[:, 1] >= y0 - BOID_RADIUS) & (points[:, 1] <= y1 + BOID_RADIUS))
+        return boids[inside]
+
+    # Boids per block of DENSITY_BLOCK screen pixels, log-scaled into color
+    def draw_density(self, points, color):
+        width, height = self.surface.get_size()
+        cols, rows = -(-width // DENSITY_BLOCK), -(-height // DENSITY_BLOCK)
+        block = (points // DENSITY_BLOCK).astype(np.int64)
+        inside = (block[:, 0] >= 0) & (block[:, 0] < cols) & (block[:, 1] >= 0) & (block[:, 1] < rows)
+        counts = np.bincount(block[inside, 0] * rows + block[inside, 1],
+                             minlength=cols * rows).reshape(cols, rows)
+        shade = np.log1p(counts) / np.log1p(max(counts.max(), 1))
+        pixels = (shade[..., None] * np.array(color)).astype(np.uint8)
+        blocks = pygame.transform.scale(pygame.surfarray.make_surface(pixels),
+                                        (cols * DENSITY_BLOCK, rows * DENSITY_BLOCK))
+        self.surface.blit(blocks, (0, 0))
+
+    def draw_obstacles(self, obstacles, camera):
+        for shape, values in obstacles:
+            if shape == "circle":
+                (x, y), = camera.to_screen(np.array([values[:2]]))
+                pygame.draw.circle(self.surface, OBSTACLE_COLOR, (int(x), int(y)),
+                                   max(1, int(values[2] * camera.zoom)))
+            else:
+                (x0, y0), (x1, y1) = camera.to_screen(np.array([values[:2], values[2:]]))
+                pygame.draw.rect(self.surface, OBSTACLE_COLOR,
+                                 pygame.Rect(int(min(x0, x1)), int(min(y0, y1)),
+                                             max(1, int(abs(x1 - x0))), max(1, int(abs(y1 - y0)))))
+
+    def draw(self, flock, weather, camera=None):
+        surface = self.surface
+        surface.fill(BLACK)
+        if camera is None:
+            camera = Camera(flock.width, flock.height, *surface.get_size())
+        if flock.obstacles is not None:
+            self.draw_obstacles(flock.obstacles.obstacles, camera)
+        boids = self.visible(flock, camera)
+        positions = flock.positions[boids]
+        points = camera.to_screen(positions[:, :2])
+        # One group of points per color: the whole flock, or each species,
+        # split by altitude in 3D
+        groups = [(boid_color(weather), np.ones(len(points), dtype=bool))]
+        if flock.species is not None:
+            species_of = flock.species_of[boids]
+            groups = [(kind.color or boid_color(weather), species_of == s)
+                      for s, kind in enumerate(flock.species.species)]
+        if positions.shape[1] == 3:
+            band = np.clip((positions[:, 2] / flock.depth * ALTITUDE_SHADES).astype(int),
+                           0, ALTITUDE_SHADES - 1)
+            groups = [(altitude_color(color, b), mask & (band == b))
+                      for b in range(ALTITUDE_SHADES) for color, mask in groups]
+        radius = BOID_RADIUS * camera.zoom
+        if radius < DENSITY_RADIUS:
+            # Density shading shows where boids are, not which kind
+            self.draw_density(points, boid_color(weather))
+        else:
+            radius = int(round(radius))
+            for color, mask in groups:
+                sprite = self.sprite(color, radius)
+                corners = (points[mask].astype(int) - radius).tolist()
+                surface.blits([(sprite, corner) for corner in corners], doreturn=False)
+        surface.blit(self.font.render(status_text(weather), True, WHITE), (10, 10))
+        return surface
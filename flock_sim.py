@@ -0,0 +1,256 @@
+# Headless weather-influenced flocking simulation on the array engine.
+#
+# Example:
+#   python flock_sim.py --boids 500 --steps 900 --wind 2 --snow 1 --fog 3 --stats --output run.csv
+#   python flock_sim.py --boids 2000 --world-depth 600 --wind 2 --updraft 0.5 --snow 2 --output run3d.csv
+
+import argparse
+import sys
+import time
+
+from flock_convergence import PATIENCE, THRESHOLD, WINDOW, Convergence
+from flock_engine import (BACKENDS, CROWDINGS, HEIGHT, INTERACTIONS, LEVELS, NUM_BOIDS,
+                          TOPOLOGICAL_NEIGHBORS, VIEW_RADIUS, WIDTH, Flock)
+from flock_metrics import BufferedMetricsWriter, metrics_header, metrics_row
+from flock_obstacles import ObstacleField
+from flock_quadtree import DEFAULT_THETA
+from flock_species import PRESETS, SpeciesMix
+from flock_trajectory import KEYFRAME_INTERVAL, TrajectoryWriter
+
+
+# Weather state, mirroring the wind/snow/fog levels of the pygame scripts.
+# A wind_direction with a third component also blows up or down in 3D.
+class Weather:
+    def __init__(self, wind_level=0, snow_level=0, fog_level=0, enabled=True,
+                 wind_direction=(1.0, 0.0)):
+        self.wind_level = wind_level  # Index in LEVELS
+        self.snow_level = snow_level  # Index in LEVELS
+        self.fog_level = fog_level    # Index in LEVELS
+        self.enabled = enabled
+        self.wind_direction = wind_direction
+
+    def wind_vector(self):
+        if not self.enabled:
+            return (0.0,) * len(self.wind_direction)
+        strength = LEVELS[self.wind_level]
+        return tuple(component * strength for component in self.wind_direction)
+
+    def snow_intensity(self):
+        return LEVELS[self.snow_level] if self.enabled else 0.0
+
+    def fog_density(self):
+        return LEVELS[self.fog_level] if self.enabled else 0.0
+
+    # Value written to the Weather_Config column
+    def config(self):
+        return str(self.wind_vector() + (self.snow_intensity(), self.fog_density()))
+
+
+class Simulation:
+    def __init__(self, flock, weather=None, sinks=(), controller=None, renderer=None,
+                 recorder=None, convergence=None, trajectory=None):
+        self.flock = flock
+        self.weather = weather if weather is not None else Weather()
+        self.sinks = list(sinks)
+        self.controller = controller
+        self.renderer = renderer
+        self.recorder = recorder
+        self.trajectory = trajectory  # flock_trajectory.TrajectoryWriter or None
+        # Convergence watches the metrics rows like any other sink
+        self.convergence = convergence
+        if convergence is not None:
+            self.sinks.append(convergence)
+        self.steps = 0
+        self.stop_reason = None
+
+    def step(self):
+        weather = self.weather
+        start = time.perf_counter()
+        self.flock.step(weather.wind_vector(), weather.snow_intensity(), weather.fog_density())
+        step_time = time.perf_counter() - start
+        self.steps += 1
+        if self.sinks:
+            row = metrics_row(self.flock, weather.config(), step_time)
+            for sink in self.sinks:
+                sink.write(row)
+        if self.recorder is not None:
+            self.recorder.write(self.renderer.draw(self.flock, weather))
+        if self.trajectory is not None:
+            self.trajectory.write(self.flock.positions, self.flock.velocities)
+
+    # Runs up to steps steps, fewer if the convergence criteria are met, and
+    # records why it stopped in stop_reason
+    def run(self, steps):
+        for _ in range(steps):
+            if self.controller is not None:
+                self.controller.apply(self)
+            self.step()
+            if self.convergence is not None and self.convergence.converged:
+                self.stop_reason = self.convergence.reason
+                return
+        self.stop_reason = f"ran all {steps} steps"
+
+
+def level(value):
+    value = int(value)
+    if not 0 <= value < len(LEVELS):
+        raise argparse.ArgumentTypeError(f"level must be between 0 and {len(LEVELS) - 1}")
+    return value
+
+
+def add_convergence_arguments(parser):
+    parser.add_argument("--converge", nargs="+", default=None, metavar="METRIC",
+                        help='stop early once these metrics settle, e.g. --converge "Avg Speed" Cohesion')
+    parser.add_argument("--converge-window", type=int, default=WINDOW,
+                        help="steps per window when comparing consecutive window means")
+    parser.add_argument("--converge-threshold", type=float, default=THRESHOLD,
+                        help="relative change between window means that counts as settled")
+    parser.add_argument("--converge-patience", type=int, default=PATIENCE,
+                        help="consecutive settled steps needed to stop")
+
+
+def build_parser():
+    # The servers pull in asyncio, so they are only imported for their ports
+    # here and when asked for in main(); importing this module stays light
+    # for sweep and analysis workers
+    from flock_control import DEFAULT_PORT as CONTROL_PORT
+    from flock_stream import DEFAULT_PORT
+
+    parser = argparse.ArgumentParser(description="Run the flocking simulation without a window.")
+    parser.add_argument("--boids", type=int, default=NUM_BOIDS, help="number of boids")
+    parser.add_argument("--steps", type=int, default=900, help="number of steps to run")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--world-width", type=int, default=WIDTH, help="world width")
+    parser.add_argument("--world-height", type=int, default=HEIGHT, help="world height")
+    parser.add_argument("--world-depth", type=int, default=None,
+                        help="world depth; simulates in 3D and renders a top-down view")
+    parser.add_argument("--scene", default=None,
+                        help="JSON file of static obstacles (see flock_obstacles.py)")
+    parser.add_argument("--species", default=None, metavar="MIX",
+                        help=f"mix of species: one of {sorted(PRESETS)} or a JSON file "
+                             "(see flock_species.py)")
+    parser.add_argument("--wind", type=level, default=0, help="wind level (index in LEVELS)")
+    parser.add_argument("--snow", type=level, default=0, help="snow level (index in LEVELS)")
+    parser.add_argument("--fog", type=level, default=0, help="fog level (index in LEVELS)")
+    parser.add_argument("--updraft", type=float, default=0.0,
+                        help="vertical part of the wind direction in 3D (negative blows down)")
+    parser.add_argument("--no-weather", action="store_true", help="disable weather effects")
+    parser.add_argument("--view-radius", type=float, default=VIEW_RADIUS,
+                        help="view radius for alignment and cohesion before fog")
+    parser.add_argument("--interaction", choices=INTERACTIONS, default="grid",
+                        help="how alignment and cohesion neighbors are found")
+    parser.add_argument("--theta", type=float, default=DEFAULT_THETA,
+                        help="quadtree opening angle (0 is exact, larger is faster)")
+    parser.add_argument("--neighbors", type=int, default=TOPOLOGICAL_NEIGHBORS,
+                        help="nearest neighbors per boid for the topological interaction")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy",
+                        help="steering backend (numba falls back to numpy if not installed)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="threads for large-flock steering (default: one per core)")
+    parser.add_argument("--skin", type=float, default=0,
+                        help="Verlet neighbor list skin distance (0 rebuilds neighbors every step)")
+    parser.add_argument("--check-neighbors", action="store_true",
+                        help="with --skin, compare the Verlet list with a full search every step")
+    parser.add_argument("--stagger", type=int, default=1,
+                        help="refresh steering for 1/STAGGER of the flock per step "
+                             "(NumPy grid interaction without --skin)")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="floating point type of positions and velocities")
+    parser.add_argument("--crowding", choices=CROWDINGS, default=None,
+                        help="crowd avoidance and Density from exact pairs or the occupancy grid "
+                             "(default: pairs, field for the topological interaction)")
+    parser.add_argument("--stats", action="store_true",
+                        help="log neighbor interaction statistics with the metrics")
+    parser.add_argument("--trace-allocations", action="store_true",
+                        help="log memory allocated per step and phase with the metrics (slow)")
+    parser.add_argument("--output", default=None, help="CSV file for per-step metrics")
+    parser.add_argument("--stream", type=int, nargs="?", const=DEFAULT_PORT, default=None,
+                        metavar="PORT", help=f"serve live metrics on localhost (default port {DEFAULT_PORT})")
+    add_convergence_arguments(parser)
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="render every step to PNG/raw frames in directory PATH, or to a video "
+                             "file if PATH ends in .mp4, .mkv, .webm, .avi or .mov (needs ffmpeg)")
+    parser.add_argument("--record-format", choices=("png", "raw", "video"), default=None,
+                        help="frame format for --record (default: from PATH)")
+    parser.add_argument("--trajectory", default=None, metavar="PATH",
+                        help="store every step's positions and velocities, compressed "
+                             "(see flock_trajectory.py)")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL,
+                        help="steps between trajectory keyframes, the granularity of seeking")
+    parser.add_argument("--control", type=int, nargs="?", const=CONTROL_PORT, default=None,
+                        metavar="PORT",
+                        help=f"accept weather, pause/step and flock size commands on localhost "
+                             f"(default port {CONTROL_PORT})")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    obstacles = None
+    if args.scene:
+        obstacles = ObstacleField.from_scene(args.scene, args.world_width, args.world_height)
+    species = SpeciesMix.load(args.species) if args.species else None
+    try:
+        flock = Flock(args.boids, args.world_width, args.world_height, seed=args.seed,
+                      collect_stats=args.stats, view_radius=args.view_radius,
+                      interaction=args.interaction, theta=args.theta, neighbors=args.neighbors,
+                      backend=args.backend, workers=args.workers, skin=args.skin,
+                      stagger=args.stagger, dtype=args.dtype, crowding=args.crowding,
+                      obstacles=obstacles, species=species, depth=args.world_depth,
+                      trace_allocations=args.trace_allocations,
+                      check_neighbors=args.check_neighbors)
+    except ValueError as error:
+        parser.error(str(error))
+    if flock.backend != args.backend:
+        print(f"Running the {flock.backend} backend: {args.backend} does not cover these options "
+              f"or is not installed", file=sys.stderr)
+    wind_direction = (1.0, 0.0) if args.world_depth is None else (1.0, 0.0, args.updraft)
+    weather = Weather(args.wind, args.snow, args.fog, enabled=not args.no_weather,
+                      wind_direction=wind_direction)
+    renderer = recorder = None
+    if args.record:
+        # pygame is only needed when rendering
+        from flock_capture import FrameRecorder
+        from flock_render import Renderer
+        # Frames are window-sized and show the whole world
+        renderer = Renderer(WIDTH, HEIGHT)
+        recorder = FrameRecorder(args.record, (WIDTH, HEIGHT), args.record_format)
+    trajectory = None
+    if args.trajectory:
+        trajectory = TrajectoryWriter(args.trajectory, flock.size, args.keyframe_interval)
+    sinks = []
+    if args.output:
+        sinks.append(BufferedMetricsWriter(args.output, metrics_header(flock)))
+    if args.stream is not None:
+        from flock_stream import MetricsStreamServer
+        sinks.append(MetricsStreamServer(metrics_header(flock), port=args.stream))
+    convergence = None
+    if args.converge:
+        convergence = Convergence(metrics_header(flock), args.converge, args.converge_window,
+                                  args.converge_threshold, args.converge_patience)
+    simulation = Simulation(flock, weather, sinks, renderer=renderer, recorder=recorder,
+                            convergence=convergence, trajectory=trajectory)
+    server = None
+    if args.control is not None:
+        from flock_control import ControlServer, Controller
+        simulation.controller = Controller()
+        server = ControlServer(simulation, simulation.controller, port=args.control)
+    try:
+        simulation.run(args.steps)
+    finally:
+        if server is not None:
+            server.close()
+        flock.close()
+        for sink in sinks:
+            sink.close()
+        if recorder is not None:
+            recorder.close()
+        if trajectory is not None:
+            trajectory.close()
+    if convergence is not None:
+        print(f"Stopped after {simulation.steps} steps: {simulation.stop_reason}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Mixed flocks of several species, e.g. prey and predators.
+#
+# Every species has its own view radius, separation distance, speed and
+# sensitivity to wind, snow and fog. How a boid of one species responds to a
+# neighbor of another comes from three interaction matrices, indexed
+# [own species, neighbor species]:
+#   alignment   weight of matching the neighbors' velocity
+#   cohesion    weight of moving to their center (negative flees from it)
+#   separation  weight of moving away from neighbors closer than the
+#               separation distance
+# Alignment and cohesion average over the neighbors of each species
+# separately, so a single predator in view counts as much as a whole flock of
+# prey. A one-species mix with the default matrices is the plain Flock.
+#
+# The whole mix shares one cell grid, sized for the species with the shortest
+# reach; species that see farther search more rings of cells around them, so
+# a few far-sighted predators do not widen the search of every prey. Each
+# pair then looks up its weights by the species of its two boids, and a mixed
+# flock costs about as much as a plain flock of its size.
+#
+# A mix is one of PRESETS or a JSON file:
+#   {"species": [{"name": "sparrow", "share": 0.98},
+#                {"name": "hawk", "share": 0.02, "view_radius": 100, "speed": 2.6,
+#                 "wind": 0.5, "snow": 0.5, "fog": 0.5, "color": [255, 80, 40]}],
+#    "alignment": [[0.05, 0], [0, 0]],
+#    "cohesion": [[0.01, -0.1], [0, 0.05]],
+#    "separation": [[0.1, 0.1], [0, 0.1]]}
+# Species fields left out take the engine's defaults and missing matrices
+# those of independent flocks of the engine's weights.
+
+import json
+
+import numpy as np
+
+from flock_engine import (ALIGNMENT_WEIGHT, BASE_SPEED, COHESION_WEIGHT, INDEX_DTYPE,
+                          MIN_VIEW_RADIUS, SEPARATION_DISTANCE, SEPARATION_WEIGHT, VIEW_RADIUS,
+                          crowd_steering, sum_by)
+
+MATRICES = ("alignment", "cohesion", "separation")
+
+PRESETS = {
+    # Sparrows flee hawks in view; hawks chase the sparrows they see and
+    # shrug off the weather more
+    "predators": {
+        "species": [
+            {"name": "sparrow", "share": 0.98},
+            {"name": "hawk", "share": 0.02, "view_radius": 100, "speed": 2.6,
+             "wind": 0.5, "snow": 0.5, "fog": 0.5, "color": [255, 80, 40]},
+        ],
+        "alignment": [[ALIGNMENT_WEIGHT, 0], [0, 0]],
+        "cohesion": [[COHESION_WEIGHT, -0.1], [0.05, 0]],
+        "separation": [[SEPARATION_WEIGHT, SEPARATION_WEIGHT], [0, SEPARATION_WEIGHT]],
+    },
+}
+
+
+class Species:
+    def __init__(self, name, share=1.0, view_radius=VIEW_RADIUS,
+                 separation_distance=SEPARATION_DISTANCE, speed=BASE_SPEED, wind=1.0, snow=1.0,
+                 fog=1.0, color=None):
+        self.name = name
+        self.share = share  # Relative part of the flock
+        self.view_radius = view_radius
+        self.separation_distance = separation_distance
+        self.speed = speed
+        self.wind = wind  # Sensitivities, multiplying the weather levels
+        self.snow = snow
+        self.fog = fog
+        self.color = tuple(color) if color is not None else None  # None: tinted by the weather
+
+
+class SpeciesMix:
+    def __init__(self, species, alignment=None, cohesion=None, separation=None):
+        self.species = list(species)
+        count = len(self.species)
+        if count == 0:
+            raise ValueError("a species mix needs at least one species")
+        defaults = {"alignment": np.eye(count) * ALIGNMENT_WEIGHT,
+                    "cohesion": np.eye(count) * COHESION_WEIGHT,
+                    "separation": np.full((count, count), float(SEPARATION_WEIGHT))}
+        given = {"alignment": alignment, "cohesion": cohesion, "separation": separation}
+        for name in MATRICES:
+            matrix = defaults[name] if given[name] is None else np.array(given[name], dtype=float)
+            if matrix.shape != (count, count):
+                raise ValueError(f"{name} matrix is {matrix.shape}, expected {(count, count)}")
+            # Flattened, indexed by own * count + neighbor
+            setattr(self, name, matrix.ravel())
+        shares = np.array([s.share for s in self.species], dtype=float)
+        if (shares < 0).any() or shares.sum() <= 0:
+            raise ValueError("species shares must be non-negative and not all zero")
+        self.shares = shares / shares.sum()
+        self.view_radius = np.array([s.view_radius for s in self.species], dtype=float)
+        self.separation_distance = np.array([s.separation_distance for s in self.species],
+                                            dtype=float)
+        self.speed = np.array([s.speed for s in self.species], dtype=float)
+        self.wind = np.array([s.wind for s in self.species], dtype=float)
+        self.snow = np.array([s.snow for s in self.species], dtype=float)
+        self.fog = np.array([s.fog for s in self.species], dtype=float)
+
+    def __len__(self):
+        return len(self.species)
+
+    @classmethod
+    def from_dict(cls, spec):
+        species = [Species(**fields) for fields in spec["species"]]
+        return cls(species, *(spec.get(name) for name in MATRICES))
+
+    # A preset name or the path of a JSON file
+    @classmethod
+    def load(cls, name_or_path):
+        if name_or_path in PRESETS:
+            return cls.from_dict(PRESETS[name_or_path])
+        with open(name_or_path) as file:
+            return cls.from_dict(json.load(file))
+
+    # Species of count boids in proportion to the shares, in species order
+    def assign(self, count):
+        quotas = self.shares * count
+        counts = np.floor(quotas).astype(np.int64)
+        # Largest remainders get the boids left over
+        counts[np.argsort(counts - quotas, kind="stable")[:count - counts.sum()]] += 1
+        return np.repeat(np.arange(len(self)), counts)
+
+    # Species of count boids drawn at random by share
+    def draw(self, count, rng):
+        return rng.choice(len(self), size=count, p=self.shares)
+
+    # View radius of each species once fog scaled by its sensitivity has set in
+    def view_radii(self, fog_density):
+        fog = np.minimum(fog_density * self.fog, 1)
+        return np.maximum(MIN_VIEW_RADIUS, self.view_radius * (1 - fog))
+
+    # Per-boid wind vector, snow intensity and base speed
+    def weather(self, species_of, wind_vector, snow_intensity):
+        wind = np.asarray(wind_vector, dtype=float) * self.wind[species_of][:, None]
+        snow = np.minimum(snow_intensity * self.snow, 1)[species_of]
+        return wind, snow, self.speed[species_of]
+
+    # Pairs (i, j) with j closer to i than the radius of i's species, in the
+    # layout of flock_engine.grid_pairs; radii is indexed by species and grid
+    # is a CellGrid whose cells are no smaller than the smallest radius
+    def pairs(self, positions, species_of, radii, grid):
+        found = []
+        pair_checks = 0
+        for s, radius in enumerate(radii):
+            src = np.flatnonzero(species_of == s).astype(INDEX_DTYPE)
+            if len(src) == 0:
+                continue
+            i, j = grid.block_pairs(src, max(1, int(np.ceil(radius / grid.cell_size))))
+            offset = positions[j] - positions[i]
+            distance = np.sqrt((offset ** 2).sum(axis=1))
+            keep = distance < radius
+            pair_checks += len(keep)
+            found.append((i[keep], j[keep], offset[keep], distance[keep]))
+        if not found:
+            empty = np.zeros(0, dtype=INDEX_DTYPE)
+            return empty, empty, np.zeros((0, positions.shape[1])), np.zeros(0), 0
+        return tuple(np.concatenate(part) for part in zip(*found)) + (pair_checks,)
+
+    # Alignment, cohesion, separation and crowd steering for every boid from
+    # one set of pairs; view_radii comes from view_radii()
+    def steer(self, positions, velocities, species_of, pairs, view_radii, stats=None, field=None):
+        i, j, offset, distance, pair_checks = pairs
+        n = len(positions)
+        count = len(self)
+        kind = species_of[i] * count + species_of[j]
+
+        view = distance < view_radii[species_of[i]]
+        vi, vj, vkind = i[view], j[view], kind[view]
+        # Neighbors in view per boid and neighbor species
+        group = vi * count + species_of[vj]
+        group_size = np.bincount(group, minlength=n * count)[group]
+        pull = ((velocities[vj] - velocities[vi]) * (self.alignment[vkind] / group_size)[:, None]
+                + offset[view] * (self.cohesion[vkind] / group_size)[:, None])
+        accel = sum_by(vi, pull, n).astype(velocities.dtype)
+
+        close = (distance > 0) & (distance < self.separation_distance[species_of[i]])
+        separation_counts = np.bincount(i[close], minlength=n)
+        if close.any():
+            away = offset[close] / distance[close][:, None] * self.separation[kind[close]][:, None]
+            accel -= sum_by(i[close], away, n)
+
+        crowd_counts = crowd_steering(positions, pairs, accel, field=field)
+        if stats is not None:
+            stats.record(pair_checks, np.bincount(vi, minlength=n), crowd_counts,
+                         separation_counts)
+        return accel, crowd_counts
@@ -0,0 +1,140 @@
+# Live metrics over a local socket.
+#
+# MetricsStreamServer is a metrics sink (write/close, like
+# BufferedMetricsWriter) that serves every row as a JSON line to TCP clients
+# on localhost. The asyncio server runs on its own thread; write() only
+# appends to a bounded deque and pokes the event loop, so the simulation
+# never waits for a client.
+# A client sends one line when it connects, e.g. {"every": 10} to receive
+# every 10th step, and each client has a bounded queue that drops its oldest
+# samples when the client falls behind.
+#
+# Reading a stream from a notebook:
+#   for sample in subscribe(every=30):
+#       print(sample["step"], sample["Avg Speed"])
+
+import asyncio
+import json
+import socket
+import threading
+from collections import deque
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+QUEUE_SIZE = 256  # Samples kept per client, and between the simulation and the loop
+HANDSHAKE_TIMEOUT = 5.0
+
+
+class MetricsStreamServer:
+    def __init__(self, header, host=DEFAULT_HOST, port=DEFAULT_PORT, queue_size=QUEUE_SIZE):
+        self.header = list(header)
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.pending = deque(maxlen=queue_size)
+        self.steps = 0
+        self.signaled = False
+        self.error = None
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-stream", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            raise self.error
+
+    # Called by the simulation every step; never blocks
+    def write(self, row):
+        self.steps += 1
+        self.pending.append((self.steps, row))
+        if not self.signaled:
+            self.signaled = True
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._shutdown)
+            self.thread.join(timeout=5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.wakeup = asyncio.Event()
+        self.closing = False
+        self.clients = {}
+        self.handlers = set()
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve, self.host, self.port))
+        except OSError as error:
+            self.error = error
+            self.started.set()
+            return
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_until_complete(self._fanout())
+        self.loop.close()
+
+    def _shutdown(self):
+        self.closing = True
+        self.wakeup.set()
+
+    async def _fanout(self):
+        while not self.closing:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            self.signaled = False
+            while self.pending:
+                step, row = self.pending.popleft()
+                sample = None
+                for queue, every in list(self.clients.items()):
+                    if step % every:
+                        continue
+                    if sample is None:
+                        sample = {"step": step, **dict(zip(self.header, row))}
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(sample)
+
+        self.server.close()
+        for queue in self.clients:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=HANDSHAKE_TIMEOUT)
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), HANDSHAKE_TIMEOUT)
+            request = json.loads(line) if line.strip() else {}
+            every = max(1, int(request.get("every", 1)))
+        except (asyncio.TimeoutError, ValueError, AttributeError, ConnectionError):
+            writer.close()
+            return
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.clients[queue] = every
+        self.handlers.add(asyncio.current_task())
+        try:
+            while True:
+                sample = await queue.get()
+                if sample is None:
+                    break
+                writer.write(json.dumps(sample).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[queue]
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+            await writer.wait_closed()
+
+
+# Blocking client: yields metrics samples as dicts until the server closes
+def subscribe(host=DEFAULT_HOST, port=DEFAULT_PORT, every=1):
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(json.dumps({"every": every}).encode() + b"\n")
+        with connection.makefile("r") as lines:
+            for line in lines:
+                yield json.loads(line)
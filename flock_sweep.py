@@ -0,0 +1,246 @@
+# Parameter sweeps over weather levels and seeds.
+#
+# Every combination of the given wind, snow and fog levels is run once per
+# seed in a process pool, each run stopping early if the convergence criteria
+# are met. The summary has one row per run with how many steps it took, why
+# it stopped and the mean of every metric over its last window of steps.
+# Runs already in the result cache (flock_cache.py) are not run again.
+#
+# With --serve the sweep is a coordinator instead (see flock_cluster.py): it
+# hands the runs missing from its cache to workers started with --worker on
+# any number of hosts, retries the runs of workers that fail or drop out,
+# and stores each summary and log in its cache as soon as it comes back.
+#
+# Examples:
+#   python flock_sweep.py --wind 0 1 2 3 --snow 0 1 2 3 --seeds 4 --steps 3000 \
+#       --converge "Avg Speed" Cohesion --output sweep.csv --logs sweep/
+#   python flock_sweep.py --wind 0 1 2 3 --snow 0 1 2 3 --seeds 32 --serve 0.0.0.0:8767
+#   python flock_sweep.py --worker coordinator-host:8767 --workers 8   # on every worker host
+
+import argparse
+import csv
+import itertools
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from flock_cache import DEFAULT_DIR, MAX_BYTES, ResultCache, cache_key
+from flock_convergence import Convergence
+from flock_engine import CROWDINGS, NUM_BOIDS, VIEW_RADIUS, Flock
+from flock_metrics import METRICS_HEADER, STEP_TIME, BufferedMetricsWriter, metrics_header
+from flock_sim import Simulation, Weather, add_convergence_arguments, level
+
+SUMMARY_METRICS = METRICS_HEADER[2:] + [STEP_TIME]
+SUMMARY_HEADER = (["Wind", "Snow", "Fog", "Seed", "Weather_Config", "Steps", "Stop Reason"]
+                  + SUMMARY_METRICS)
+
+
+# Keeps the last window of metrics rows of a run
+class Tail:
+    def __init__(self, header, window):
+        self.columns = [header.index(name) for name in SUMMARY_METRICS]
+        self.rows = deque(maxlen=window)
+
+    def write(self, row):
+        self.rows.append([row[column] for column in self.columns])
+
+    def close(self):
+        pass
+
+    def means(self):
+        return np.mean(self.rows, axis=0).tolist() if self.rows else [float("nan")] * len(self.columns)
+
+
+# Everything that determines the outcome of one run
+def run_params(args, wind, snow, fog, seed):
+    return {
+        "boids": args.boids, "steps": args.steps, "seed": seed,
+        "wind": wind, "snow": snow, "fog": fog, "weather_enabled": not args.no_weather,
+        "view_radius": args.view_radius, "crowding": args.crowding,
+        "converge": args.converge, "converge_window": args.converge_window,
+        "converge_threshold": args.converge_threshold, "converge_patience": args.converge_patience,
+    }
+
+
+def log_path(logs, params):
+    return os.path.join(logs, f"w{params['wind']}_s{params['snow']}_f{params['fog']}_seed{params['seed']}.csv")
+
+
+# Summary row of one run
+def run_one(params, logs=None):
+    flock = Flock(params["boids"], seed=params["seed"], view_radius=params["view_radius"],
+                  crowding=params["crowding"])
+    weather = Weather(params["wind"], params["snow"], params["fog"], enabled=params["weather_enabled"])
+    header = metrics_header(flock)
+    tail = Tail(header, params["converge_window"])
+    sinks = [tail]
+    if logs:
+        sinks.append(BufferedMetricsWriter(log_path(logs, params), header))
+    convergence = None
+    if params["converge"]:
+        convergence = Convergence(header, params["converge"], params["converge_window"],
+                                  params["converge_threshold"], params["converge_patience"])
+    simulation = Simulation(flock, weather, sinks, convergence=convergence)
+    try:
+        simulation.run(params["steps"])
+    finally:
+        flock.close()
+        for sink in sinks:
+            sink.close()
+    return ([params["wind"], params["snow"], params["fog"], params["seed"], weather.config(),
+             simulation.steps, simulation.stop_reason] + tail.means())
+
+
+# Fingerprint of the engine version and constants, which a worker must share
+# with its coordinator for their results to be interchangeable
+def engine_fingerprint():
+    return cache_key({}, kind="engine")
+
+
+# Runs one job handed out by serve_runs and returns the summary row and, if
+# asked for, the metrics log
+def run_job(job):
+    if job["engine"] != engine_fingerprint():
+        raise RuntimeError("this worker's engine differs from the coordinator's")
+    params = job["params"]
+    if not job["log"]:
+        return {"row": run_one(params), "log": None}
+    with tempfile.TemporaryDirectory() as logs:
+        row = run_one(params, logs)
+        with open(log_path(logs, params), newline="") as file:
+            return {"row": row, "log": file.read()}
+
+
+# Serves runs to workers pulling them over TCP from host:port; store(k, row)
+# is called as the summary of runs[k] comes back, after its log is written
+def serve_runs(runs, host, port, store, logs=None, attempts=None, lease=None):
+    # Like the servers of flock_sim.py, only imported when used: asyncio
+    # would slow down the start of every local pool worker
+    from flock_cluster import ATTEMPTS, Coordinator
+
+    def on_result(k, result):
+        if logs:
+            with open(log_path(logs, runs[k]), "w", newline="") as file:
+                file.write(result["log"])
+        store(k, result["row"])
+
+    engine = engine_fingerprint()
+    jobs = [{"params": params, "log": bool(logs), "engine": engine} for params in runs]
+    coordinator = Coordinator(jobs, host, port, attempts or ATTEMPTS, lease, on_result)
+    print(f"Serving {len(runs)} runs on {coordinator.host}:{coordinator.port}", flush=True)
+    coordinator.run()
+
+
+# Summary rows of all runs, and how many of them came from the cache. With
+# serve=(host, port) the runs go to remote workers instead of a local pool.
+def run_sweep(runs, logs=None, workers=None, cache=None, serve=None, attempts=None, lease=None):
+    if logs:
+        os.makedirs(logs, exist_ok=True)
+    keys = [cache_key(params) for params in runs]
+    rows = [None] * len(runs)
+    if cache is not None:
+        for i, (params, key) in enumerate(zip(runs, keys)):
+            summary = cache.get(key)
+            if summary is None:
+                continue
+            if logs:
+                cached_log = cache.log(key)
+                if cached_log is None:
+                    continue  # Rerun to get the log
+                shutil.copyfile(cached_log, log_path(logs, params))
+            rows[i] = summary
+    todo = [i for i, row in enumerate(rows) if row is None]
+
+    def store(i, row):
+        rows[i] = row
+        if cache is not None:
+            cache.put(keys[i], row, log_path(logs, runs[i]) if logs else None)
+
+    if serve is not None:
+        if todo:
+            serve_runs([runs[i] for i in todo], *serve, lambda k, row: store(todo[k], row),
+                       logs, attempts, lease)
+        return rows, len(runs) - len(todo)
+    if workers == 1 or len(todo) <= 1:
+        results = [run_one(runs[i], logs) for i in todo]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(run_one, [runs[i] for i in todo], [logs] * len(todo)))
+    for i, row in zip(todo, results):
+        store(i, row)
+    return rows, len(runs) - len(todo)
+
+
+def build_parser():
+    from flock_cluster import ATTEMPTS, DEFAULT_PORT, address
+
+    parser = argparse.ArgumentParser(description="Run the simulation over a grid of weather levels.")
+    for name in ("wind", "snow", "fog"):
+        parser.add_argument(f"--{name}", type=level, nargs="+", default=[0], help=f"{name} levels to sweep")
+    parser.add_argument("--seeds", type=int, default=1, help="runs per weather configuration")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run of each configuration")
+    parser.add_argument("--boids", type=int, default=NUM_BOIDS, help="number of boids")
+    parser.add_argument("--steps", type=int, default=900, help="maximum steps per run")
+    parser.add_argument("--no-weather", action="store_true", help="disable weather effects")
+    parser.add_argument("--view-radius", type=float, default=VIEW_RADIUS,
+                        help="view radius for alignment and cohesion before fog")
+    parser.add_argument("--crowding", choices=CROWDINGS, default="pairs",
+                        help="crowd avoidance and Density from exact pairs or the occupancy grid")
+    add_convergence_arguments(parser)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes running configurations (default: one per core)")
+    parser.add_argument("--serve", type=address, default=None, metavar="[HOST:]PORT",
+                        help="coordinate: hand the runs to --worker processes connecting to this "
+                             f"address (e.g. 0.0.0.0:{DEFAULT_PORT} for other hosts)")
+    parser.add_argument("--worker", type=address, default=None, metavar="[HOST:]PORT",
+                        help="work for the coordinator at this address with --workers processes; "
+                             "the sweep options come from the coordinator")
+    parser.add_argument("--attempts", type=int, default=ATTEMPTS,
+                        help="times a run is handed to a worker before the sweep gives up on it")
+    parser.add_argument("--lease", type=float, default=None, metavar="SECONDS",
+                        help="hand a run out again if its worker has not finished it by then "
+                             "(default: only when the worker fails or disconnects)")
+    parser.add_argument("--cache", default=DEFAULT_DIR, help="directory of the result cache")
+    parser.add_argument("--cache-size", type=float, default=MAX_BYTES / 2 ** 20,
+                        help="result cache size in MiB before least recently used runs are evicted")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor fill the result cache")
+    parser.add_argument("--logs", default=None, help="directory for the per-step metrics of every run")
+    parser.add_argument("--output", default="sweep.csv", help="CSV file for the per-run summary")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.worker is not None:
+        if args.serve is not None:
+            parser.error("--worker and --serve are exclusive")
+        from flock_cluster import run_workers
+        host, port = args.worker
+        finished = run_workers(host, port, run_job, args.workers or os.cpu_count() or 1)
+        print(f"{finished} runs done for {host}:{port}")
+        return
+    if args.converge:
+        unknown = [name for name in args.converge if name not in SUMMARY_METRICS]
+        if unknown:
+            parser.error(f"unknown metrics {unknown}, expected some of {SUMMARY_METRICS}")
+    runs = [run_params(args, wind, snow, fog, args.seed + r)
+            for wind, snow, fog in itertools.product(args.wind, args.snow, args.fog)
+            for r in range(args.seeds)]
+    cache = None if args.no_cache else ResultCache(args.cache, int(args.cache_size * 2 ** 20))
+    rows, cached = run_sweep(runs, args.logs, args.workers, cache, args.serve, args.attempts,
+                             args.lease)
+    with open(args.output, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(SUMMARY_HEADER)
+        writer.writerows(rows)
+    print(f"{len(rows)} runs ({cached} cached), {sum(row[5] for row in rows)} steps, "
+          f"{sum(row[5] < args.steps for row in rows)} stopped early -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
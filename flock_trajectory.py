@@ -0,0 +1,367 @@
+# Compressed storage of whole flock trajectories.
+#
+# Every step is quantized to integers:
+#   positions   fixed point, 1 / POSITION_SCALE of a world unit
+#   velocities  heading (and pitch in 3D) in HEADING_UNITS per turn, and
+#               speed in 1 / SPEED_SCALE units per step
+# Frames are grouped into chunks that start with a keyframe holding the full
+# quantized state. Every other frame stores only its change from the frame
+# before it (across a wrap-around the short way round), and for positions
+# only how much that change differs from the previous one, since boids keep
+# going roughly the same way. Each channel of a frame takes the smallest
+# integer type that holds its values. Each chunk is
+# zlib-compressed on its own, and an index of chunk offsets at the end of the
+# file lets readers seek to any frame by decoding at most one chunk. Files
+# cut short without the index are still read by scanning the chunk headers.
+#
+# TrajectoryWriter.write() only copies the state and queues it; quantizing,
+# delta encoding and compression happen on a writer thread.
+#
+# Example:
+#   python flock_sim.py --boids 10000 --steps 1800 --trajectory run.traj
+#   python flock_trajectory.py run.traj --frame 900 --output frame900.csv
+
+import argparse
+import bisect
+import csv
+import json
+import queue
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+MAGIC = b"FLOCKTRJ"
+VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+INDEX_MAGIC = b"INDX"
+CHUNK_HEADER = struct.Struct("<4sIIIQ")  # magic, first frame, frames, boids, compressed bytes
+INDEX_ENTRY = struct.Struct("<IIIQQ")    # first frame, frames, boids, offset, compressed bytes
+FOOTER = struct.Struct("<Q4s")           # index offset, INDEX_MAGIC
+
+POSITION_SCALE = 16    # Fixed point steps per world unit
+HEADING_UNITS = 4096  # Heading (and pitch) steps per full turn
+SPEED_SCALE = 1024     # Fixed point steps per unit of speed
+KEYFRAME_INTERVAL = 30  # Frames per chunk, one second at 30 FPS
+COMPRESSION_LEVEL = 1
+QUEUE_SIZE = 8  # Frames buffered between the simulation and the writer
+
+DELTA_DTYPES = (np.int8, np.int16, np.int32)
+
+
+# Number of quantized channels for dims dimensions: one per position axis,
+# heading, pitch in 3D, and speed
+def channel_count(dims):
+    return 2 * dims
+
+
+# Range of each channel that wraps around, or 0 for channels that do not
+def channel_moduli(size):
+    positions = [int(round(extent * POSITION_SCALE)) + 1 for extent in size]
+    angles = [HEADING_UNITS] + [0] * (len(size) - 2)  # Pitch stays within half a turn
+    return np.array(positions + angles + [0], dtype=np.int64)
+
+
+# Quantized state as an (channels, boids) int64 array
+def quantize(positions, velocities, size):
+    dims = positions.shape[1]
+    moduli = channel_moduli(size)
+    channels = np.empty((channel_count(dims), len(positions)), dtype=np.int64)
+    for axis in range(dims):
+        channels[axis] = np.clip(np.rint(positions[:, axis] * POSITION_SCALE), 0, moduli[axis] - 1)
+    horizontal = np.hypot(velocities[:, 0], velocities[:, 1])
+    turn = HEADING_UNITS / (2 * np.pi)
+    channels[dims] = np.rint(np.arctan2(velocities[:, 1], velocities[:, 0]) * turn) % HEADING_UNITS
+    if dims == 3:
+        channels[dims + 1] = np.rint(np.arctan2(velocities[:, 2], horizontal) * turn)
+    speed = np.sqrt((velocities ** 2).sum(axis=1))
+    channels[-1] = np.rint(speed * SPEED_SCALE)
+    return channels
+
+
+def dequantize(channels, dims):
+    positions = (channels[:dims] / POSITION_SCALE).T
+    heading = channels[dims] * (2 * np.pi / HEADING_UNITS)
+    speed = channels[-1] / SPEED_SCALE
+    if dims == 3:
+        pitch = channels[dims + 1] * (2 * np.pi / HEADING_UNITS)
+        horizontal = speed * np.cos(pitch)
+        velocities = np.stack([horizontal * np.cos(heading), horizontal * np.sin(heading),
+                               speed * np.sin(pitch)], axis=1)
+    else:
+        velocities = np.stack([speed * np.cos(heading), speed * np.sin(heading)], axis=1)
+    return positions, velocities
+
+
+# Smallest integer type holding every value
+def delta_dtype(values):
+    low, high = (int(values.min()), int(values.max())) if values.size else (0, 0)
+    for dtype in DELTA_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+# Frame bytes: one type code (the item size) per channel, then each channel
+def encode_frame(channels):
+    dtypes = [delta_dtype(channel) for channel in channels]
+    parts = [bytes(dtype.itemsize for dtype in dtypes)]
+    parts += [channel.astype(dtype).tobytes() for channel, dtype in zip(channels, dtypes)]
+    return b"".join(parts)
+
+
+def decode_frame(data, offset, count, boids):
+    itemsizes = data[offset:offset + count]
+    offset += count
+    channels = np.empty((count, boids), dtype=np.int64)
+    for c, itemsize in enumerate(itemsizes):
+        dtype = np.dtype(f"<i{itemsize}")
+        channels[c] = np.frombuffer(data, dtype, boids, offset)
+        offset += itemsize * boids
+    return channels, offset
+
+
+class TrajectoryWriter:
+    def __init__(self, path, size, keyframe_interval=KEYFRAME_INTERVAL,
+                 level=COMPRESSION_LEVEL, queue_size=QUEUE_SIZE):
+        self.size = tuple(size)
+        self.dims = len(self.size)
+        self.moduli = channel_moduli(self.size)[:, None]
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.level = level
+        self.file = open(path, "wb")
+        header = json.dumps({"version": VERSION, "size": self.size, "position_scale": POSITION_SCALE,
+                             "heading_units": HEADING_UNITS, "speed_scale": SPEED_SCALE,
+                             "keyframe_interval": self.keyframe_interval}).encode()
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.index = []
+        self.frames = 0
+        self.error = None
+        # Writer thread state: the chunk being built and its last frame
+        self.compressor = None
+        self.chunk = []
+        self.chunk_start = self.chunk_frames = self.chunk_boids = 0
+        self.previous = None
+        self.previous_delta = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._run, name="trajectory-writer", daemon=True)
+        self.thread.start()
+
+    # Called by the simulation every step; waits only when the writer has
+    # fallen a whole queue behind
+    def write(self, positions, velocities):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((np.array(positions), np.array(velocities)))
+        self.frames += 1
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is None:
+            try:
+                self._finish_chunk()
+                index_offset = self.file.tell()
+                self.file.write(INDEX_MAGIC + struct.pack("<I", len(self.index)))
+                for entry in self.index:
+                    self.file.write(INDEX_ENTRY.pack(*entry))
+                self.file.write(FOOTER.pack(index_offset, INDEX_MAGIC))
+            except OSError as error:
+                self.error = error
+        self.file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        while True:
+            state = self.queue.get()
+            if state is None:
+                return
+            if self.error is not None:
+                continue  # Keep draining so write() never blocks forever
+            try:
+                self._encode(quantize(*state, self.size))
+            except Exception as error:
+                self.error = error
+
+    def _encode(self, channels):
+        boids = channels.shape[1]
+        if self.previous is None or self.chunk_frames >= self.keyframe_interval or boids != self.chunk_boids:
+            self._finish_chunk()
+            self.compressor = zlib.compressobj(self.level)
+            self.chunk_start += self.chunk_frames
+            self.chunk_frames = 0
+            self.chunk_boids = boids
+            self.previous_delta = None
+            residual = channels
+        else:
+            delta = channels - self.previous
+            # Wrapped channels take the shorter way round
+            wraps = self.moduli[:, 0] > 0
+            half = self.moduli[wraps] // 2
+            delta[wraps] = (delta[wraps] + half) % self.moduli[wraps] - half
+            residual = delta.copy()
+            if self.previous_delta is not None:
+                residual[:self.dims] -= self.previous_delta[:self.dims]
+            self.previous_delta = delta
+        self.chunk.append(self.compressor.compress(encode_frame(residual)))
+        self.chunk_frames += 1
+        self.previous = channels
+
+    def _finish_chunk(self):
+        if self.compressor is None:
+            return
+        self.chunk.append(self.compressor.flush())
+        data = b"".join(self.chunk)
+        offset = self.file.tell()
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, self.chunk_start, self.chunk_frames,
+                                          self.chunk_boids, len(data)))
+        self.file.write(data)
+        self.index.append((self.chunk_start, self.chunk_frames, self.chunk_boids, offset, len(data)))
+        self.compressor = None
+        self.chunk = []
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trajectory file")
+        (length,) = struct.unpack("<I", self.file.read(4))
+        self.header = json.loads(self.file.read(length))
+        if self.header["version"] != VERSION:
+            raise ValueError(f"{path} has trajectory version {self.header['version']}, expected {VERSION}")
+        self.size = tuple(self.header["size"])
+        self.dims = len(self.size)
+        self.moduli = channel_moduli(self.size)[:, None]
+        self.data_start = self.file.tell()
+        self.chunks = self._read_index() or self._scan()
+        self.starts = [chunk[0] for chunk in self.chunks]
+        self.cached = None  # (chunk number, decompressed bytes)
+
+    def __len__(self):
+        last = self.chunks[-1] if self.chunks else (0, 0)
+        return last[0] + last[1]
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_index(self):
+        self.file.seek(0, 2)
+        end = self.file.tell()
+        if end - self.data_start < FOOTER.size:
+            return None
+        self.file.seek(end - FOOTER.size)
+        index_offset, magic = FOOTER.unpack(self.file.read(FOOTER.size))
+        if magic != INDEX_MAGIC:
+            return None
+        self.file.seek(index_offset)
+        if self.file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            return None
+        (count,) = struct.unpack("<I", self.file.read(4))
+        return [INDEX_ENTRY.unpack(self.file.read(INDEX_ENTRY.size)) for _ in range(count)]
+
+    # Chunk list of a file whose index was never written
+    def _scan(self):
+        chunks = []
+        offset = self.data_start
+        while True:
+            self.file.seek(offset)
+            header = self.file.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                break
+            magic, first, frames, boids, length = CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC or len(self.file.read(length)) < length:
+                break  # Index or a chunk cut short
+            chunks.append((first, frames, boids, offset, length))
+            offset += CHUNK_HEADER.size + length
+        return chunks
+
+    def _chunk_data(self, number):
+        if self.cached is None or self.cached[0] != number:
+            _, _, _, offset, length = self.chunks[number]
+            self.file.seek(offset + CHUNK_HEADER.size)
+            self.cached = number, zlib.decompress(self.file.read(length))
+        return self.cached[1]
+
+    # Quantized frames of one chunk, from its keyframe up to frame stop
+    def _decode(self, number, stop=None):
+        first, frames, boids, _, _ = self.chunks[number]
+        data = self._chunk_data(number)
+        count = channel_count(self.dims)
+        wraps = self.moduli[:, 0] > 0
+        offset = 0
+        channels = previous_delta = None
+        for frame in range(first, first + frames if stop is None else stop + 1):
+            delta, offset = decode_frame(data, offset, count, boids)
+            if channels is None:
+                channels = delta
+                yield frame, channels
+                continue
+            if previous_delta is not None:
+                delta[:self.dims] += previous_delta[:self.dims]
+            previous_delta = delta
+            channels = channels + delta
+            channels[wraps] %= self.moduli[wraps]
+            yield frame, channels
+
+    # Positions and velocities of one frame
+    def frame(self, frame):
+        if not 0 <= frame < len(self):
+            raise IndexError(f"frame {frame} out of range 0..{len(self) - 1}")
+        number = bisect.bisect_right(self.starts, frame) - 1
+        for _, channels in self._decode(number, frame):
+            pass
+        return dequantize(channels, self.dims)
+
+    def __iter__(self):
+        for number in range(len(self.chunks)):
+            for _, channels in self._decode(number):
+                yield dequantize(channels, self.dims)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Inspect or export a recorded trajectory.")
+    parser.add_argument("path", help="trajectory file written with flock_sim.py --trajectory")
+    parser.add_argument("--frame", type=int, default=None, help="frame to export")
+    parser.add_argument("--output", default=None, help="CSV file for the exported frame (default: stdout)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    with TrajectoryReader(args.path) as reader:
+        if args.frame is None:
+            boids = sum(chunk[1] * chunk[2] for chunk in reader.chunks)
+            stored = sum(chunk[4] for chunk in reader.chunks)
+            raw = boids * reader.dims * 2 * 8  # float64 positions and velocities
+            print(f"{len(reader)} frames in {len(reader.chunks)} chunks, world {reader.size}, "
+                  f"{stored} bytes ({raw / max(stored, 1):.1f}x smaller than float64)")
+            return
+        if not 0 <= args.frame < len(reader):
+            parser.error(f"--frame must be between 0 and {len(reader) - 1}")
+        positions, velocities = reader.frame(args.frame)
+    axes = "xyz"[:reader.dims]
+    file = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(file)
+        writer.writerow([f"P{a}" for a in axes] + [f"V{a}" for a in axes])
+        writer.writerows(np.hstack([positions, velocities]).round(4).tolist())
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == "__main__":
+    main()